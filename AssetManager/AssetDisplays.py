@@ -9,19 +9,21 @@ from GtkHelper.GtkHelper import better_disconnect
 
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Adw
+from gi.repository import Gtk, Adw, Gio
 from .AssetManager import AssetManager
 
-class AssetPreview(Gtk.FlowBoxChild):
-    def __init__(self, window: "AssetManagerWindow", name: str, size: tuple[int, int] = (50,50), *args, **kwargs):
-        super().__init__(*args, **kwargs)
+class AssetDisplay:
+    """
+    Base UI shared by the previews of the FlowBox pages and the cells of the GridView pages: a main box for the
+    content and a reset button overlayed on top of it
+    """
+    def setup_display(self, window: "AssetManagerWindow", size: tuple[int, int]):
         self.set_css_classes(["asset-preview"])
         self.set_margin_start(5)
         self.set_margin_end(5)
         self.set_margin_top(5)
         self.set_margin_bottom(5)
 
-        self.name = name
         self.size = size
 
         self.set_size_request(self.size[0], self.size[1])
@@ -44,13 +46,42 @@ class AssetPreview(Gtk.FlowBoxChild):
         self.reset_button.set_margin_end(10)
         self.overlay.add_overlay(self.reset_button)
 
-        self.set_child(self.overlay)
+        self.set_overlay(self.overlay)
 
-        self.set_size_request(self.size[0], self.size[1])
+    def set_overlay(self, overlay: Gtk.Overlay):
+        raise NotImplementedError
 
     def build(self):
         pass
 
+class AssetPreview(AssetDisplay, Gtk.FlowBoxChild):
+    def __init__(self, window: "AssetManagerWindow", name: str, size: tuple[int, int] = (50,50), *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = name
+        self.setup_display(window, size)
+
+    def set_overlay(self, overlay: Gtk.Overlay):
+        self.set_child(overlay)
+
+class AssetCell(AssetDisplay, Gtk.Box):
+    """
+    Cell of the virtualized asset pages, the GridView reuses cells while scrolling by binding them to other assets
+    """
+    def __init__(self, window: "AssetManagerWindow", size: tuple[int, int] = (50,50), *args, **kwargs):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, *args, **kwargs)
+        self.window: "AssetManagerWindow" = window
+        self.name: str = None
+        self.setup_display(window, size)
+
+    def set_overlay(self, overlay: Gtk.Overlay):
+        self.append(overlay)
+
+    def bind(self, name: str, asset):
+        self.name = name
+
+    def unbind(self):
+        self.name = None
+
 class AssetManagerWindow(Adw.PreferencesWindow):
     def __init__(self, asset_manager: AssetManager, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -58,7 +89,7 @@ class AssetManagerWindow(Adw.PreferencesWindow):
 
         self.set_default_size(500, 500)
 
-    def build_asset_page(self, title, group_name, icon_name):
+    def build_page_base(self, title, group_name, icon_name):
         page = Adw.PreferencesPage(title=title)
         group = Adw.PreferencesGroup(title=group_name)
         page.add(group)
@@ -74,6 +105,14 @@ class AssetManagerWindow(Adw.PreferencesWindow):
         scrolled_window = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
         group.add(scrolled_window)
 
+        return page, search_entry, scrolled_window
+
+    def build_asset_page(self, title, group_name, icon_name):
+        """
+        :return: The page, the FlowBox and the SearchEntry of the page
+        """
+        page, search_entry, scrolled_window = self.build_page_base(title, group_name, icon_name)
+
         flow_box = Gtk.FlowBox(hexpand=True, orientation=Gtk.Orientation.HORIZONTAL,
                                     selection_mode=Gtk.SelectionMode.SINGLE, valign=Gtk.Align.START)
         flow_box.set_max_children_per_line(3)
@@ -82,7 +121,51 @@ class AssetManagerWindow(Adw.PreferencesWindow):
 
         scrolled_window.set_child(flow_box)
 
-        return page, flow_box
+        return page, flow_box, search_entry
+
+    def build_palette_page(self, title, group_name, icon_name, palette_view: Gtk.Widget):
+        """
+        Builds a page that shows all colors in a single PaletteView
+        :return: The page and the SearchEntry of the page
+        """
+        page, search_entry, scrolled_window = self.build_page_base(title, group_name, icon_name)
+
+        # The PaletteView scrolls on its own, it only gets as large as the visible part of the scrolled window
+        scrolled_window.set_min_content_height(400)
+        scrolled_window.set_child(palette_view)
+
+        return page, search_entry
+
+    def build_virtual_asset_page(self, title, group_name, icon_name, model: Gio.ListModel | Gtk.SelectionModel,
+                                 cell_type: type[AssetCell], cell_size: tuple[int, int] = (100, 100)):
+        """
+        Builds a page that shows the model in a GridView, only the visible cells get created and bound
+        :return: The page, the GridView and the SearchEntry of the page
+        """
+        page, search_entry, scrolled_window = self.build_page_base(title, group_name, icon_name)
+
+        # The GridView can only skip invisible cells when the scrolled window doesn't grow to fit all of them
+        scrolled_window.set_min_content_height(400)
+
+        if not isinstance(model, Gtk.SelectionModel):
+            model = Gtk.SingleSelection(model=model)
+
+        grid_view = Gtk.GridView(model=model, factory=self.create_cell_factory(cell_type, cell_size),
+                                 max_columns=3, single_click_activate=True, hexpand=True)
+        scrolled_window.set_child(grid_view)
+
+        return page, grid_view, search_entry
+
+    def create_cell_factory(self, cell_type: type[AssetCell], cell_size: tuple[int, int]) -> Gtk.SignalListItemFactory:
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", lambda _, list_item: list_item.set_child(cell_type(window=self, size=cell_size)))
+        factory.connect("bind", self.on_cell_bind)
+        factory.connect("unbind", lambda _, list_item: list_item.get_child().unbind())
+        return factory
+
+    def on_cell_bind(self, factory, list_item: Gtk.ListItem):
+        item = list_item.get_item()
+        list_item.get_child().bind(item.name, item.asset)
 
     def connect_flow_box(self, flow_box: Gtk.FlowBox, callback: callable):
         flow_box.connect("child-activated", callback)
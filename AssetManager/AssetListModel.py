@@ -0,0 +1,242 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Exposes the merged assets of a Manager as a Gio.ListModel so they can be shown in list based widgets like Gtk.GridView,
+which only create widgets for the visible items and reuse them while scrolling.
+"""
+
+import threading
+
+import gi
+
+gi.require_version("Gtk", "4.0")
+from gi.repository import Gio, GLib, GObject, Gtk
+
+from .AssetManagerBackend import Asset, Manager, ManagerEvent, get_event_keys
+from .AssetSearch import SearchIndex
+
+class AssetItem(GObject.Object):
+    __gtype_name__ = "AssetManagerAssetItem"
+
+    def __init__(self, name: str, asset: Asset):
+        super().__init__()
+        self.name: str = name
+        self.asset: Asset = asset
+
+class AssetListModel:
+    # Batches touching more keys than this rebuild the whole store in one splice
+    REBUILD_THRESHOLD = 64
+
+    def __init__(self, manager: Manager):
+        self.manager: Manager = manager
+        self.store = Gio.ListStore.new(AssetItem)
+
+        self._names: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._items: dict[str, AssetItem] = {}
+        self._pending: set[str] = set()
+        self._rebuild_pending: bool = False
+        self._idle_id: int = 0
+        self._lock = threading.Lock()
+
+        self.rebuild()
+        self.manager.add_listener(self.on_manager_event, weak=True)
+
+    def close(self):
+        self.manager.remove_listener(self.on_manager_event)
+
+        if self._idle_id:
+            GLib.source_remove(self._idle_id)
+            self._idle_id = 0
+
+    def get_item(self, name: str) -> AssetItem | None:
+        return self._items.get(name, None)
+
+    def rebuild(self):
+        assets = self.manager.get_assets_merged()
+        items = [AssetItem(name, asset) for name, asset in list(assets.items())]
+
+        self._names = [item.name for item in items]
+        self._positions = {name: position for position, name in enumerate(self._names)}
+        self._items = {item.name: item for item in items}
+        self.store.splice(0, self.store.get_n_items(), items)
+
+    def refresh(self, name: str):
+        """
+        Makes the view bind the cell of the asset again, e.g. after state outside of the asset changed
+        """
+        if name in self._items:
+            self.store.splice(self._positions[name], 1, [self._items[name]])
+
+    #
+    # EVENTS
+    #
+
+    def on_manager_event(self, event: ManagerEvent, *args):
+        # Listeners may run on worker threads, the store is only touched on the main loop
+        with self._lock:
+            keys = get_event_keys(event, args)
+            if len(keys) > self.REBUILD_THRESHOLD:
+                self._rebuild_pending = True
+            self._pending.update(keys)
+
+            if not self._idle_id:
+                self._idle_id = GLib.idle_add(self._apply_pending)
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            rebuild, self._rebuild_pending = self._rebuild_pending, False
+            self._idle_id = 0
+
+        if rebuild:
+            self.rebuild()
+            return GLib.SOURCE_REMOVE
+
+        removed = []
+        for name in pending:
+            if not self._sync(name):
+                removed.append(name)
+
+        self._remove(removed)
+        return GLib.SOURCE_REMOVE
+
+    def _sync(self, name: str) -> bool:
+        """
+        Adds or updates the item of the asset
+        :return: False if the asset is gone and its item has to be removed
+        """
+        asset = self.manager.get_asset(name)
+        position = self._positions.get(name, -1)
+
+        if asset is None:
+            return position < 0
+        elif position < 0:
+            self._positions[name] = len(self._names)
+            self._names.append(name)
+            self._items[name] = AssetItem(name, asset)
+            self.store.append(self._items[name])
+        else:
+            # Replacing the item makes the view bind the visible cell again
+            self._items[name] = AssetItem(name, asset)
+            self.store.splice(position, 1, [self._items[name]])
+        return True
+
+    def _remove(self, names: list[str]):
+        """
+        Removes the items of the assets, the positions of the remaining items get updated once for all of them
+        """
+        removed = {name for name in names if name in self._positions}
+        if not removed:
+            return
+
+        positions = sorted((self._positions.pop(name) for name in removed), reverse=True)
+
+        # Removed back to front so the positions of the other removed items stay valid
+        for position in positions:
+            self.store.remove(position)
+
+        for name in removed:
+            del self._items[name]
+
+        self._names = [name for name in self._names if name not in removed]
+        for position in range(positions[-1], len(self._names)):
+            self._positions[self._names[position]] = position
+
+class AssetSearchModel:
+    """
+    Selection model for the GridView that shows either all assets or the ranked results of the current query.
+    Results are looked up in the SearchIndex and put into their own store, so a keystroke only costs as much as there
+    are matches instead of running a filter over every asset.
+    """
+    def __init__(self, list_model: AssetListModel, index: SearchIndex = None):
+        self.list_model: AssetListModel = list_model
+        self.index: SearchIndex = index
+
+        if self.index is None:
+            self.index = SearchIndex()
+            self.index.watch(list_model.manager)
+
+        self.query: str = ""
+        self.results = Gio.ListStore.new(AssetItem)
+        self.selection = Gtk.SingleSelection(model=list_model.store)
+
+        self.list_model.store.connect("items-changed", self.on_items_changed)
+
+    def close(self):
+        self.index.unwatch()
+
+    def set_query(self, query: str):
+        self.query = query.strip()
+
+        if not self.query:
+            self.selection.set_model(self.list_model.store)
+            self.results.remove_all()
+            return
+
+        items = [self.list_model.get_item(key) for key, _ in self.index.search(self.query)]
+        self.results.splice(0, self.results.get_n_items(), [item for item in items if item is not None])
+
+        if self.selection.get_model() is not self.results:
+            self.selection.set_model(self.results)
+
+    def on_search_changed(self, search_entry: Gtk.SearchEntry):
+        self.set_query(search_entry.get_text())
+
+    def on_items_changed(self, *args):
+        if self.query:
+            self.set_query(self.query)
+
+class FlowBoxSearch:
+    """
+    Filters and ranks the previews of a FlowBox page with the results of a SearchIndex. The children of the FlowBox
+    need a name attribute holding their asset key, like AssetPreview.
+    """
+    def __init__(self, flow_box: Gtk.FlowBox, manager: Manager, index: SearchIndex = None):
+        self.flow_box: Gtk.FlowBox = flow_box
+        self.index: SearchIndex = index
+        self._owns_index: bool = index is None
+
+        if self.index is None:
+            self.index = SearchIndex()
+            self.index.watch(manager)
+
+        self.query: str = ""
+        self.ranks: dict[str, int] = None
+
+        self.flow_box.set_filter_func(self.filter_child)
+
+    def close(self):
+        if self._owns_index:
+            self.index.unwatch()
+
+    def set_query(self, query: str):
+        self.query = query.strip()
+
+        if not self.query:
+            self.ranks = None
+            # Without a query the previews go back to the order they were added in
+            self.flow_box.set_sort_func(None)
+        else:
+            self.ranks = {key: rank for rank, (key, _) in enumerate(self.index.search(self.query))}
+            self.flow_box.set_sort_func(self.sort_children)
+
+        self.flow_box.invalidate_filter()
+
+    def refresh(self):
+        """
+        Runs the query again, e.g. after assets got added or removed
+        """
+        if self.query:
+            self.set_query(self.query)
+
+    def on_search_changed(self, search_entry: Gtk.SearchEntry):
+        self.set_query(search_entry.get_text())
+
+    def filter_child(self, child: Gtk.FlowBoxChild) -> bool:
+        return self.ranks is None or child.name in self.ranks
+
+    def sort_children(self, child_a: Gtk.FlowBoxChild, child_b: Gtk.FlowBoxChild) -> int:
+        last = len(self.ranks)
+        return self.ranks.get(child_a.name, last) - self.ranks.get(child_b.name, last)
@@ -3,50 +3,193 @@ Author: G4PLS
 Year: 2024
 """
 
-import json
 import os.path
+import secrets
+import stat
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
 from .AssetManagerBackend import Asset, Manager
+from .AssetWatcher import AssetWatcher
+from .IconAtlas import IconAtlas
+from .MediaCache import InternTable, LRUCache, RenderCache, estimate_media_bytes
+from .Palette import ColorStore, Palette
+from .Serializers import JsonSerializer, Serializer, detect_serializer, get_serializer
+from .Observer import DispatchMode
 from src.backend.DeckManagement.Media.Media import Media
 
+from loguru import logger as log
 
 class Color(Asset):
+    # Themes can hold thousands of colors, the values of all Colors live in one store and every Color only holds the
+    # index of its slot in there. Without a __dict__ every Color is a smaller object.
+    store = ColorStore()
+    __slots__ = ("_slot",)
+
     def __init__(self, *args, **kwargs):
-        self._color: tuple[int, int, int, int] = (0,0,0,0)
+        self._slot: int = None
 
         super().__init__(*args, **kwargs)
 
+    def __del__(self):
+        if self._slot is not None:
+            self.store.free(self._slot)
+
+    @property
+    def slot(self) -> int:
+        return self._slot
+
     def change(self, *args, **kwargs):
-        self._color = kwargs.get("color", (0,0,0,0))
+        color = kwargs.get("color", (0,0,0,0))
+
+        if self._slot is None:
+            self._slot = self.store.allocate(color)
+        else:
+            self.store.write(self._slot, color)
 
     def get_values(self):
-        return self._color
+        return self.store.read(self._slot)
+
+    def get_floats(self) -> tuple[float, float, float, float]:
+        """
+        Returns the color normalized to 0-1 like Gdk.RGBA expects it
+        """
+        return self.store.read_floats(self._slot)
 
     def to_json(self):
-        return list(self._color)
+        return list(self.get_values())
 
     @classmethod
     def from_json(cls, *args):
         return cls(color=tuple(args[0]))
 
+class DecodedIcon:
+    """
+    The decoded Media of an icon file with its rendered image, unpacks like a (media, rendered) tuple
+    """
+    __slots__ = ("media", "rendered")
+
+    def __init__(self, media, rendered):
+        self.media = media
+        self.rendered = rendered
+
+    def __iter__(self):
+        return iter((self.media, self.rendered))
+
 class Icon(Asset):
+    # Recently used media of files that no icon points at anymore, kept around in case they come back
+    cache = LRUCache(max_items=128, max_bytes=128 * 1024 * 1024,
+                     size_of=lambda values: sum(estimate_media_bytes(value) for value in values))
+    # Decoded media of the files icons point at, shared by all icons showing the same file. Moves to the cache once
+    # the last icon pointing at the file is gone.
+    interned = InternTable(size_of=cache.size_of, on_release=cache.put)
+    # Used by icons that didn't get a render cache from their AssetManager, None by default
+    render_cache: RenderCache = None
+
     def __init__(self, *args, **kwargs):
-        self._icon: Media = None
-        self._rendered: Media = None
         self._path: str = None
+        self._cache_key: tuple = None
+        self._release: weakref.finalize = None
+        self._render_cache: RenderCache = None
 
         super().__init__(*args, **kwargs)
 
     def change(self, *args, **kwargs):
         path = kwargs.get("path", None)
 
-        if os.path.isfile(path):
+        if path and os.path.isfile(path):
+            stat = os.stat(path)
             self._path = path
-            self._icon = Media.from_path(path)
-            self._rendered = self._icon.get_final_media()
+            self._set_cache_key((os.path.realpath(path), stat.st_mtime_ns, stat.st_size))
+
+    def _set_cache_key(self, cache_key: tuple):
+        if cache_key == self._cache_key:
+            return
+
+        # The reference to the old file is released right away, the reference to the new one once the icon is gone
+        if self._release:
+            self._release()
+
+        Icon.interned.acquire(cache_key)
+        self._cache_key = cache_key
+        self._release = weakref.finalize(self, Icon.interned.release, cache_key)
 
     def get_values(self):
-        return self._icon, self._rendered
+        """
+        Decodes the icon the first time it's needed
+        :return: The Media and its rendered image or (None, None) if no valid path is set
+        """
+        if not self._cache_key:
+            return None, None
+
+        icon, rendered = Icon.interned.get_or_load(self._cache_key, self._load_cached)
+
+        # Only the rendered image came from the render cache, the Media still has to be decoded
+        if icon is None:
+            decoded = DecodedIcon(*self._decode())
+            if not Icon.interned.set(self._cache_key, decoded):
+                Icon.cache.put(self._cache_key, decoded)
+            icon, rendered = decoded
+        return icon, rendered
+
+    def get_rendered(self):
+        """
+        Returns only the rendered image, on a warm start this is read from the render cache without decoding the icon
+        """
+        if not self._cache_key:
+            return None
+        return Icon.interned.get_or_load(self._cache_key, self._load_cached).rendered
+
+    def preload(self):
+        """
+        Renders the icon, the result is held by Icon.interned as long as this icon points at the file, so it isn't
+        rendered again on first use no matter how many icons got preloaded
+        """
+        self.get_rendered()
+
+    def get_path(self) -> str | None:
+        return self._path
+
+    def get_identity(self) -> tuple | None:
+        """
+        Identifies the file this icon shows, changes when the file gets replaced or modified
+        """
+        return self._cache_key
+
+    def _load_cached(self):
+        # Files that are interned again are taken out of the cache, it only holds files no icon points at
+        decoded = Icon.cache.pop(self._cache_key)
+        return decoded if decoded is not None else self._load()
+
+    def get_render_cache(self) -> RenderCache | None:
+        return self._render_cache or Icon.render_cache
+
+    def attach_render_cache(self, render_cache: RenderCache | None):
+        """
+        Stores the rendered image in the render cache of the AssetManager the icon got added to. Icons that are part
+        of several AssetManagers keep the first one.
+        """
+        if self._render_cache is None:
+            self._render_cache = render_cache
+
+    def _load(self):
+        render_cache = self.get_render_cache()
+
+        if render_cache:
+            rendered = render_cache.get(self._path)
+            if rendered is not None:
+                return DecodedIcon(None, rendered)
+
+        icon, rendered = self._decode()
+
+        if render_cache:
+            render_cache.put(self._path, rendered)
+        return DecodedIcon(icon, rendered)
+
+    def _decode(self):
+        icon = Media.from_path(self._path)
+        return icon, icon.get_final_media()
 
     def to_json(self):
         return self._path
@@ -55,28 +198,282 @@ class Icon(Asset):
     def from_json(cls, *args):
         return cls(path=args[0])
 
+    @classmethod
+    def configure_cache(cls, max_items: int = None, max_bytes: int = None):
+        """
+        Sets the limits of the cache for files no icon points at anymore, None means unbounded.
+        Files icons point at are held by Icon.interned until the last of these icons is gone.
+        """
+        cls.cache.configure(max_items, max_bytes)
+
+    @classmethod
+    def set_render_cache(cls, render_cache: RenderCache | None):
+        """
+        Sets the render cache of icons that don't belong to an AssetManager with its own render cache
+        """
+        cls.render_cache = render_cache
+
 class AssetManager:
-    def __init__(self, save_path: str):
+    RENDER_CACHE_DIR = "render_cache"
+
+    def __init__(self, save_path: str, dispatch_mode: DispatchMode = DispatchMode.THREADED, render_cache: bool = True,
+                 save_delay: float = None, load_workers: int = None, save_format: str = JsonSerializer.name,
+                 load_sections: list[str] = None):
+        """
+        :param render_cache: Keeps the rendered icons in a render_cache directory next to the save file
+        :param save_delay: When set, save() only marks the AssetManager as dirty and the file gets written once no
+                           further save() happened for that many seconds. Call flush() to write it right away.
+        :param load_workers: When set, overrides get loaded and their icons rendered on that many worker threads
+        :param save_format: "json", "compact-json" or "binary". Files in another format are still read and get
+                            rewritten in this format right after loading.
+        :param load_sections: Save keys of the Managers to load on creation, e.g. ["icons"], all Managers when not set.
+                              Pass an empty list to load nothing, the rest can be loaded later with load().
+        """
         self.save_path = save_path
-        self.colors = Manager(Color, "colors")
-        self.icons = Manager(Icon, "icons")
-        self.load()
+        self.serializer: Serializer = get_serializer(save_format)
+        self.save_delay: float = save_delay
+        self.load_workers: int = load_workers
+        self.load_failures: dict[str, dict[str, Exception]] = {}
+
+        self._dirty: bool = False
+        self._last_saved: bytes = None
+        self._save_timer: threading.Timer = None
+        self._save_lock = threading.RLock()
+        # Save keys of the Managers that got loaded, the file keeps the other sections as they are when saving
+        self._loaded_sections: set[str] = set()
+
+        self.render_cache: RenderCache = None
+        if render_cache:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(save_path)), self.RENDER_CACHE_DIR)
+            self.render_cache = RenderCache.get_shared(cache_dir)
+
+        self.colors = Manager(Color, "colors", dispatch_mode)
+        self.icons = Manager(Icon, "icons", dispatch_mode, prepare_asset=self._prepare_icon)
+        self._palette: Palette = None
+        self._icon_atlases: dict[tuple[int, int], IconAtlas] = {}
+        self._icon_watcher: AssetWatcher = None
+        self.load(load_sections)
+
+    def _prepare_icon(self, icon: Icon):
+        icon.attach_render_cache(self.render_cache)
+
+    def get_palette(self) -> Palette:
+        """
+        Returns a Palette of the merged colors, created the first time it's requested.
+        It shares the store of the Colors, so it links its keys to them instead of copying their values.
+        """
+        if self._palette is None:
+            self._palette = Palette(store=Color.store)
+            self._palette.watch(self.colors)
+        return self._palette
+
+    def get_icon_atlas(self, size: tuple[int, int]) -> IconAtlas:
+        """
+        Returns an IconAtlas with all merged icons scaled to fit size, created the first time a size is requested
+        """
+        size = tuple(size)
+        if size not in self._icon_atlases:
+            atlas = IconAtlas(size)
+            atlas.watch(self.icons)
+            self._icon_atlases[size] = atlas
+        return self._icon_atlases[size]
+
+    def watch_icons(self, interval: float = 1.0, backend: str = AssetWatcher.BACKEND_AUTO,
+                    batch: bool = False) -> AssetWatcher:
+        """
+        Starts reloading icons whose files change on disk
+        :param interval: Seconds between checks for changed files
+        :param backend: "poll", "inotify" or "auto"
+        :param batch: Reports the icons reloaded by one check in a single BATCH event
+        """
+        if self._icon_watcher is None:
+            self._icon_watcher = AssetWatcher(self.icons, interval, backend, batch)
+            self._icon_watcher.start()
+        return self._icon_watcher
+
+    def stop_watching_icons(self):
+        if self._icon_watcher:
+            self._icon_watcher.stop()
+            self._icon_watcher = None
+
+    def close(self):
+        self.stop_watching_icons()
+        self.flush()
+        if self._palette:
+            self._palette.unwatch()
+        for atlas in self._icon_atlases.values():
+            atlas.unwatch()
+        self.colors.close()
+        self.icons.close()
+
+    def log_listener_report(self):
+        """
+        Logs the live listeners of every Manager
+        """
+        for manager in (self.icons, self.colors):
+            report = manager.get_listener_report()
+            lines = [f"{entry['listener']} (weak: {entry['weak']}, events: {entry['topics'] or 'all'}, "
+                     f"keys: {entry['keys'] or 'all'})" for entry in report]
+            log.info(f"{len(report)} listeners on {manager.get_save_key()}:" + "".join(f"\n{line}" for line in lines))
+
+    def is_dirty(self) -> bool:
+        return self._dirty
 
     def save(self):
+        with self._save_lock:
+            self._dirty = True
+
+            if self.save_delay is None:
+                self.flush()
+                return
+
+            # Every save restarts the delay so a burst of changes ends up as one write
+            if self._save_timer:
+                self._save_timer.cancel()
+
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """
+        Writes pending changes right away, does nothing if nothing changed since the last write
+        """
+        with self._save_lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+                self._save_timer = None
+
+            if not self._dirty:
+                return
+
+            data = self._serialize()
+            if data != self._last_saved:
+                self._write(data)
+                self._last_saved = data
+
+            # Only cleared once the write succeeded, a failed write is tried again by the next flush()
+            self._dirty = False
+
+    def _serialize(self) -> bytes:
         save_json = {}
         save_json[self.colors.get_save_key()] = self.colors.get_override_json()
         save_json[self.icons.get_save_key()] = self.icons.get_override_json()
 
-        with open(self.save_path, "w") as file:
-            json.dump(save_json, file, indent = 4)
+        # Sections that weren't loaded are taken from the file, overrides added to them since then are kept on top
+        unloaded = [save_key for save_key in save_json if save_key not in self._loaded_sections]
+        if unloaded and os.path.isfile(self.save_path):
+            _, file_json = self._read(unloaded)
+            for save_key in unloaded:
+                save_json[save_key] = {**((file_json or {}).get(save_key) or {}), **save_json[save_key]}
+
+        return self.serializer.dumps(save_json)
+
+    def _write(self, data: bytes):
+        # Written to a temporary file first so a crash mid-write never leaves a half written save file behind
+        directory = os.path.dirname(os.path.abspath(self.save_path))
+        file_descriptor, temp_path = self._create_temp_file(directory)
 
-    def load(self):
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+
+            # New save files keep the mode the umask gave the temporary file, existing ones the permissions they had
+            mode = self._get_file_mode()
+            if mode is not None:
+                os.chmod(temp_path, mode)
+            os.replace(temp_path, self.save_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _get_file_mode(self) -> int | None:
+        try:
+            return stat.S_IMODE(os.stat(self.save_path).st_mode)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _create_temp_file(directory: str) -> tuple[int, str]:
+        # Unlike mkstemp, which always creates the file readable only by the owner, the umask decides the mode here
+        while True:
+            temp_path = os.path.join(directory, f".assets-{secrets.token_hex(8)}.tmp")
+            try:
+                return os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666), temp_path
+            except FileExistsError:
+                continue
+
+    def load(self, sections: list[str] = None):
+        """
+        Loads the overrides from the save file, the format of the file is detected automatically
+        :param sections: Save keys of the Managers to load, e.g. ["icons"], all Managers when not set. Saving keeps the
+                         sections that weren't loaded as they are in the file.
+        """
         if not os.path.isfile(self.save_path):
+            self._loaded_sections.update(self._get_save_keys())
             return
 
-        with open(self.save_path) as file:
-            json_data = json.load(file)
+        serializer, json_data = self._read(sections)
 
         if json_data:
-            self.icons.load_json(json_data)
-            self.colors.load_json(json_data)
\ No newline at end of file
+            self._load_managers(lambda manager, executor: manager.load_json(json_data, executor), sections)
+        self._loaded_sections.update(self._get_save_keys() if sections is None else sections)
+
+        self._last_saved = self._serialize()
+
+        # Migrates files written in another format
+        if serializer is not self.serializer:
+            self._last_saved = None
+            self.save()
+
+    def reload(self, sections: list[str] = None, batch: bool = False):
+        """
+        Brings the overrides in line with the save file after it got changed outside of this AssetManager.
+        Only overrides that differ from the file get built again or removed, unchanged ones are kept as they are.
+        Changes that weren't written yet get dropped.
+        :param sections: Save keys of the Managers to reload, e.g. ["icons"], all Managers when not set
+        :param batch: Listeners get a single BATCH event per Manager instead of one event per changed override
+        """
+        if not os.path.isfile(self.save_path):
+            return
+
+        _, json_data = self._read(sections)
+
+        with self._save_lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+                self._save_timer = None
+            self._dirty = False
+
+        # Listeners run without holding the save lock, they may call save() from the threads they get dispatched on
+        self._load_managers(lambda manager, executor: manager.reload_json(json_data or {}, executor, batch), sections)
+
+        with self._save_lock:
+            self._loaded_sections.update(self._get_save_keys() if sections is None else sections)
+            self._last_saved = self._serialize()
+
+    def _read(self, sections: list[str] = None) -> tuple[Serializer, dict]:
+        with open(self.save_path, "rb") as file:
+            serializer = detect_serializer(file.peek(16)[:16])
+            return serializer, serializer.load(file, sections)
+
+    def _get_save_keys(self) -> list[str]:
+        return [manager.get_save_key() for manager in (self.icons, self.colors)]
+
+    def _load_managers(self, load: callable, save_keys: list[str] = None):
+        """
+        Calls load with every Manager and the executor to build assets on and stores the failures it returns
+        """
+        managers = [manager for manager in (self.icons, self.colors)
+                    if save_keys is None or manager.get_save_key() in save_keys]
+
+        if self.load_workers:
+            with ThreadPoolExecutor(max_workers=self.load_workers, thread_name_prefix="AssetLoader") as executor:
+                for manager in managers:
+                    self.load_failures[manager.get_save_key()] = load(manager, executor)
+        else:
+            for manager in managers:
+                self.load_failures[manager.get_save_key()] = load(manager, None)
@@ -5,11 +5,19 @@ Year: 2024
 
 import enum
 import json
+import threading
+from concurrent.futures import Executor
+from contextlib import contextmanager, nullcontext
 from types import MappingProxyType
 
-from .Observer import Observer
+from .Observer import Observer, DispatchMode
+from .ObserverStats import ObserverStats
+
+from loguru import logger as log
 
 class Asset:
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         self.change(*args, **kwargs)
 
@@ -19,6 +27,13 @@ class Asset:
     def get_values(self):
         pass
 
+    def preload(self):
+        """
+        Does the expensive work needed before the values can be used, called on worker threads by parallel loads.
+        The result has to stay with the asset until it's used, otherwise the parallel work is done again on first use.
+        """
+        pass
+
     def to_json(self):
         pass
 
@@ -33,33 +48,66 @@ class ManagerEvent(enum.Enum):
     OVERRIDE_ADD = "override_add",
     OVERRIDE_REMOVE = "override_remove",
     OVERRIDE_CHANGE = "override_change"
+    BATCH = "batch"
+
+def get_event_keys(event: ManagerEvent, args: tuple) -> set[str]:
+    """
+    Returns the keys a Manager event is about, for BATCH events every key of the batch
+    :param args: The arguments the listener got after the event
+    """
+    if event == ManagerEvent.BATCH:
+        return {key for event_keys in args[0].values() for key in event_keys}
+    return {args[0]}
 
 class Manager:
-    def __init__(self, asset_type: type, json_key: str):
+    def __init__(self, asset_type: type, json_key: str, dispatch_mode: DispatchMode = DispatchMode.THREADED,
+                 prepare_asset: callable = None):
+        """
+        :param prepare_asset: Called with every asset before it gets added or preloaded, e.g. to hand it a cache
+        """
         self._asset_type: type = asset_type
+        self._prepare_asset: callable = prepare_asset
         self._assets: dict[str, asset_type] = {}
         self._asset_overrides: dict[str, asset_type] = {}
-        self._observer = Observer()
+        self._observer = Observer(dispatch_mode)
+
+        # Kept up to date on every change so get_assets_merged doesn't have to rebuild it
+        self._merged: dict[str, asset_type] = {}
+        self._merged_view = MappingProxyType(self._merged)
+        self._version: int = 0
+
+        # Events collected while inside of batch(), maps the event to the affected keys in order and the arguments of
+        # their last event. Kept per thread so
+        # changes made by other threads, e.g. the AssetWatcher, never end up in the batch of this one
+        self._batch_local = threading.local()
         self._json_key = json_key
 
     # Assets
 
     def add_asset(self, key: str, asset: Asset, override: bool = False):
         if not self._assets.__contains__(key) or override:
+            self._prepare(asset)
             self._assets[key] = asset
-            self._observer.notify(ManagerEvent.ADD, key, asset)
+            if not self._asset_overrides.__contains__(key):
+                self._merged[key] = asset
+            self._version += 1
+            self._notify(ManagerEvent.ADD, key, asset)
 
     def remove_asset(self, key: str):
         if self._assets.__contains__(key):
             del self._assets[key]
-            self._observer.notify(ManagerEvent.REMOVE, key)
+            if not self._asset_overrides.__contains__(key):
+                del self._merged[key]
+            self._version += 1
+            self._notify(ManagerEvent.REMOVE, key)
 
-    def change_asset(self, key: str, *values):
+    def change_asset(self, key: str, *values, **kwargs):
         if self._assets.__contains__(key):
             asset = self.get_asset(key, skip_override=True)
-            asset.change(*values)
+            asset.change(*values, **kwargs)
             self._assets[key] = asset
-            self._observer.notify(ManagerEvent.CHANGE, key, asset, {values: values})
+            self._version += 1
+            self._notify(ManagerEvent.CHANGE, key, asset, {"values": values, **kwargs})
 
     # Overrides
 
@@ -68,20 +116,88 @@ class Manager:
             return
 
         if not self._asset_overrides.__contains__(key) or override:
+            self._prepare(asset)
             self._asset_overrides[key] = asset
-            self._observer.notify(ManagerEvent.OVERRIDE_ADD, key, asset)
+            self._merged[key] = asset
+            self._version += 1
+            self._notify(ManagerEvent.OVERRIDE_ADD, key, asset)
 
     def remove_override(self, key: str):
         if self._asset_overrides.__contains__(key):
             del self._asset_overrides[key]
-            self._observer.notify(ManagerEvent.OVERRIDE_REMOVE, key)
-
-    def change_override(self, key: str, *values):
+            if self._assets.__contains__(key):
+                self._merged[key] = self._assets[key]
+            else:
+                del self._merged[key]
+            self._version += 1
+            self._notify(ManagerEvent.OVERRIDE_REMOVE, key)
+
+    def change_override(self, key: str, *values, **kwargs):
         if self._asset_overrides.__contains__(key):
             override = self.get_asset(key)
-            override.change(*values)
+            override.change(*values, **kwargs)
             self._asset_overrides[key] = override
-            self._observer.notify(ManagerEvent.OVERRIDE_CHANGE, key, override, {"values": values})
+            self._version += 1
+            self._notify(ManagerEvent.OVERRIDE_CHANGE, key, override, {"values": values, **kwargs})
+
+    # Batch
+
+    @contextmanager
+    def batch(self):
+        """
+        Collects the events of all changes made inside the with block and emits a single BATCH event at the end.
+        The BATCH event passes a mapping from every ManagerEvent that occurred to the keys it affected.
+        BATCH only reaches listeners of all events and listeners of BATCH. Listeners of specific events get the events
+        of the batch one by one instead, with the arguments of the last event of every key.
+        Batches can be nested, the event is emitted when the outermost batch ends. Only changes made by the thread
+        that opened the batch are collected, other threads keep emitting their events as usual.
+
+        with manager.batch():
+            manager.add_asset("a", asset_a)
+            manager.add_asset("b", asset_b)
+        """
+        state = self._batch_local
+        depth = getattr(state, "depth", 0)
+        if not depth:
+            state.events = {}
+        state.depth = depth + 1
+
+        try:
+            yield self
+        finally:
+            state.depth -= 1
+
+            if not state.depth:
+                events, state.events = state.events, None
+
+                if events:
+                    self._publish_batch(events)
+
+    def _publish_batch(self, events: dict[ManagerEvent, dict[str, tuple]]):
+        affected = {event: tuple(keys) for event, keys in events.items()}
+        keys = {key for event_keys in events.values() for key in event_keys}
+
+        self._observer.publish_where(self._accepts_batch, (ManagerEvent.BATCH, *affected), keys,
+                                     ManagerEvent.BATCH, MappingProxyType(affected))
+
+        for event, event_keys in events.items():
+            for key, args in event_keys.items():
+                self._observer.publish_where(self._rejects_batch, (event,), (key,), event, key, *args)
+
+    @staticmethod
+    def _accepts_batch(events: frozenset | None) -> bool:
+        return events is None or ManagerEvent.BATCH in events
+
+    @staticmethod
+    def _rejects_batch(events: frozenset | None) -> bool:
+        return events is not None and ManagerEvent.BATCH not in events
+
+    def _notify(self, event: ManagerEvent, key: str, *args):
+        state = self._batch_local
+        if getattr(state, "depth", 0):
+            state.events.setdefault(event, {})[key] = args
+            return
+        self._observer.notify(event, key, *args)
 
     # Getter
 
@@ -107,17 +223,63 @@ class Manager:
         return MappingProxyType(self._asset_overrides)
 
     def get_assets_merged(self) -> MappingProxyType[str, Asset]:
-        combined = {**self._assets, **self._asset_overrides}
-        return MappingProxyType(combined)
+        """
+        Returns a live read-only view of all assets where overrides replace the asset of the same key.
+        The view always reflects the current state, use get_version to check if anything changed since the last look.
+        """
+        return self._merged_view
+
+    def get_version(self) -> int:
+        """
+        Returns a counter that increases on every change of the assets or overrides
+        """
+        return self._version
 
     # Observer
 
-    def add_listener(self, callback: callable):
-        self._observer.subscribe(callback)
+    def add_listener(self, callback: callable, events: ManagerEvent | list[ManagerEvent] = None,
+                     keys: str | list[str] = None, weak: bool = False):
+        """
+        Adds a listener that gets called on changes
+        :param events: Only call the listener for these events, by default it's called for all of them
+        :param keys: Only call the listener for changes of these keys, by default it's called for all of them
+        :param weak: When set, listeners that are bound methods don't keep their object alive, the listener gets
+                     removed once the object got collected. Functions and lambdas are always kept.
+        """
+        self._observer.subscribe(callback, events, keys, weak)
 
     def remove_listener(self, callback: callable):
         self._observer.unsubscribe(callback)
 
+    def get_listener_report(self) -> list[dict]:
+        """
+        Returns the live listeners with their event and key filters, handy to find listeners that should be gone
+        """
+        return self._observer.get_subscribers()
+
+    def set_dispatch_mode(self, mode: DispatchMode):
+        self._observer.mode = mode
+
+    def enable_listener_stats(self, log_interval: float = None) -> ObserverStats:
+        """
+        Starts recording how often and how long every listener runs per event
+        :param log_interval: When set the slowest listeners get logged every log_interval seconds
+        :return: The stats, query them with get_stats() or get_slowest()
+        """
+        stats = self._observer.enable_stats(f"{self._json_key} Manager")
+        if log_interval:
+            stats.start_logging(log_interval)
+        return stats
+
+    def get_listener_stats(self) -> ObserverStats | None:
+        return self._observer.stats
+
+    def disable_listener_stats(self):
+        self._observer.disable_stats()
+
+    def close(self):
+        self._observer.close()
+
     # Save/Load
 
     def get_asset_json(self):
@@ -126,18 +288,126 @@ class Manager:
     def get_override_json(self):
         out = {}
 
-        for key, asset in self._asset_overrides.items():
+        # Copied first as the save might happen on another thread while overrides get changed
+        for key, asset in list(self._asset_overrides.items()):
             out[key] = asset.to_json()
         return out
 
-    def load_json(self, json_data: dict):
+    def load_json(self, json_data: dict, executor: Executor = None) -> dict[str, Exception]:
+        """
+        Loads the overrides from the json data, assets that fail to load are skipped
+        :param executor: When passed the assets are built and preloaded on it, they still get added in file order
+        :return: The keys of the assets that couldn't be loaded with the error that occurred
+        """
         json = json_data.get(self._json_key, None)
+        failures = {}
 
         if not json:
-            return
-
-        for key, value in json.items():
-            self.add_override(key, self._asset_type.from_json(value), skip_asset_check=True)
+            return failures
+
+        if executor:
+            results = [(key, executor.submit(self._build_asset, value)) for key, value in json.items()]
+        else:
+            results = [(key, value) for key, value in json.items()]
+
+        with self.batch():
+            for key, result in results:
+                try:
+                    asset = result.result() if executor else self._asset_type.from_json(result)
+                except Exception as e:
+                    failures[key] = e
+                    log.warning(f"Could not load {self._json_key} asset {key}: {e}")
+                    continue
+
+                self.add_override(key, asset, skip_asset_check=True)
+        return failures
+
+    def reload_json(self, json_data: dict, executor: Executor = None, batch: bool = False) -> dict[str, Exception]:
+        """
+        Brings the overrides in line with the json data. Only overrides whose json differs get built again, overrides
+        missing from the json data get removed. Emits OVERRIDE_ADD, OVERRIDE_REMOVE and OVERRIDE_CHANGE for exactly
+        the keys that differ.
+        :param executor: When passed the new assets are built and preloaded on it
+        :param batch: Emits a single BATCH event for all differences instead of one event per key
+        :return: The keys of the assets that couldn't be loaded with the error that occurred, they keep their old value
+        """
+        json = json_data.get(self._json_key, None) or {}
+        current = self.get_override_json()
+        failures = {}
+
+        removed = [key for key in current if key not in json]
+        changed = {key: value for key, value in json.items() if key not in current or current[key] != value}
+
+        if executor:
+            results = [(key, executor.submit(self._build_asset, value)) for key, value in changed.items()]
+        else:
+            results = [(key, value) for key, value in changed.items()]
+
+        with self.batch() if batch else nullcontext():
+            for key in removed:
+                self.remove_override(key)
+
+            for key, result in results:
+                try:
+                    asset = result.result() if executor else self._asset_type.from_json(result)
+                except Exception as e:
+                    failures[key] = e
+                    log.warning(f"Could not reload {self._json_key} asset {key}: {e}")
+                    continue
+
+                if key not in self._asset_overrides:
+                    self.add_override(key, asset, skip_asset_check=True)
+                    continue
+
+                self._prepare(asset)
+                self._asset_overrides[key] = asset
+                self._merged[key] = asset
+                self._version += 1
+                self._notify(ManagerEvent.OVERRIDE_CHANGE, key, asset, {"values": (changed[key],)})
+        return failures
+
+    def _build_asset(self, value):
+        asset = self._asset_type.from_json(value)
+        self._prepare(asset)
+        asset.preload()
+        return asset
+
+    def _prepare(self, asset: Asset):
+        if self._prepare_asset and asset is not None:
+            self._prepare_asset(asset)
 
     def get_save_key(self):
-        return self._json_key
\ No newline at end of file
+        return self._json_key
+
+class ManagerMirror:
+    """
+    Base of objects that mirror the merged assets of a Manager, e.g. the Palette or the IconAtlas.
+    After watch every key changed by an event gets passed to sync, subclasses implement sync.
+    """
+    _manager: Manager = None
+
+    def watch(self, manager: Manager):
+        """
+        Syncs all merged assets of the Manager and keeps them up to date with its events
+        """
+        self._manager = manager
+
+        self.sync_all(manager)
+        manager.add_listener(self.on_manager_event, weak=True)
+
+    def unwatch(self):
+        if self._manager:
+            self._manager.remove_listener(self.on_manager_event)
+            self._manager = None
+
+    def on_manager_event(self, event: ManagerEvent, *args):
+        self.sync(self._manager, get_event_keys(event, args))
+
+    def sync_all(self, manager: Manager):
+        self.sync(manager, list(manager.get_assets_merged()))
+
+    def sync(self, manager: Manager, keys):
+        """
+        Brings the keys in line with the merged assets of the Manager, keys without an asset get removed
+        """
+        pass
\ No newline at end of file
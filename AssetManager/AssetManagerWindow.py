@@ -2,69 +2,120 @@
 Author: G4PLS
 Year: 2024
 """
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
 from src.backend.DeckManagement.ImageHelpers import image2pixbuf
-from .AssetDisplays import AssetManagerWindow, AssetPreview
+from .AssetDisplays import AssetManagerWindow, AssetPreview, AssetCell
+from .AssetListModel import AssetListModel, AssetItem, AssetSearchModel, FlowBoxSearch
 from .AssetManager import AssetManager, Icon, Color
+from .AssetManagerBackend import Manager, ManagerEvent, get_event_keys
+from .ColorSwatches import ColorSwatch, PaletteView
+from .IconAtlas import IconAtlas
+from .ThumbnailCache import thumbnail_cache
 
 import gi
 
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Gio, GdkPixbuf, Pango, Gdk
+from gi.repository import Gtk, Gio, GdkPixbuf, Pango, Gdk, GLib, Adw
+
+from loguru import logger as log
+
+def scale_to_fit(pixbuf: GdkPixbuf.Pixbuf, size: tuple[int, int]) -> GdkPixbuf.Pixbuf:
+    original_width = pixbuf.get_width()
+    original_height = pixbuf.get_height()
+
+    scale = min(size[0] / original_width, size[1] / original_height)
+
+    new_width = int(original_width * scale)
+    new_height = int(original_height * scale)
+
+    return pixbuf.scale_simple(new_width, new_height, GdkPixbuf.InterpType.BILINEAR)
+
+def color_to_rgba(color: tuple[int, int, int, int]) -> Gdk.RGBA:
+    return floats_to_rgba(tuple(value / 255.0 for value in color))
+
+def floats_to_rgba(normalized: tuple[float, float, float, float]) -> Gdk.RGBA:
+    rgba = Gdk.RGBA()
+    rgba.red = normalized[0]
+    rgba.green = normalized[1]
+    rgba.blue = normalized[2]
+    rgba.alpha = normalized[3]
+    return rgba
+
+def rgba_to_color(rgba: Gdk.RGBA) -> tuple[int, int, int, int]:
+    return (rgba.red * 255,
+            rgba.green * 255,
+            rgba.blue * 255,
+            rgba.alpha * 255)
 
 class IconPreview(AssetPreview):
-    def __init__(self, image, *args, **kwargs):
+    def __init__(self, image, *args, identity=None, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.image = image
-        self.pixbuf = image2pixbuf(image)
+        self.identity = identity
+        self.pixbuf = None
         self.build()
 
-    def scale_pixbuf(self):
-        original_width = self.pixbuf.get_width()
-        original_height = self.pixbuf.get_height()
-        w = self.size[0]
-        h = self.size[1]
-
-        scale = min(w / original_width, h / original_height)
-
-        new_width = int(original_width * scale)
-        new_height = int(original_height * scale)
+    def get_thumbnail(self):
+        """
+        Returns the scaled pixbuf, shared through the thumbnail cache when the identity of the image is known
+        """
+        return thumbnail_cache.get(self.name, self.identity, self.size, self.scale_pixbuf)
 
-        return self.pixbuf.scale_simple(new_width, new_height, GdkPixbuf.InterpType.BILINEAR)
+    def scale_pixbuf(self):
+        if self.pixbuf is None:
+            self.pixbuf = image2pixbuf(self.image)
+        return scale_to_fit(self.pixbuf, self.size)
 
     def build(self):
         self.picture = Gtk.Picture(width_request=self.size[0], height_request=self.size[1], overflow=Gtk.Overflow.HIDDEN,
                                    content_fit=Gtk.ContentFit.COVER,
                                    hexpand=False, vexpand=False, keep_aspect_ratio=True)
-        self.picture.set_pixbuf(self.scale_pixbuf())
+        self.picture.set_pixbuf(self.get_thumbnail())
 
         self.main_box.append(self.picture)
 
+        self.spinner = Gtk.Spinner(halign=Gtk.Align.CENTER, valign=Gtk.Align.CENTER, visible=False)
+        self.overlay.add_overlay(self.spinner)
+
         self.label = Gtk.Label(label=self.name, xalign=Gtk.Align.CENTER, hexpand=False, ellipsize=Pango.EllipsizeMode.END,
                                max_width_chars=20,
                                margin_start=20, margin_end=20)
         self.main_box.append(self.label)
 
-    def set_image(self, image):
+    def set_image(self, image, identity=None):
         self.image = image
-        self.pixbuf = image2pixbuf(self.image)
-        self.picture.set_pixbuf(self.scale_pixbuf())
+        self.identity = identity
+        self.pixbuf = None
+        self.picture.set_pixbuf(self.get_thumbnail())
+
+    def set_loading(self, loading: bool):
+        """
+        Shows a spinner over the dimmed image while a new image is being decoded
+        """
+        self.spinner.set_visible(loading)
+        self.spinner.set_spinning(loading)
+        self.picture.set_opacity(0.3 if loading else 1.0)
 
 class ColorPreview(AssetPreview):
-    def __init__(self, color: tuple[int, int, int, int], *args, **kwargs):
+    def __init__(self, color: tuple[int, int, int, int], *args, rgba: Gdk.RGBA = None, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.color = color
+        self.rgba: Gdk.RGBA = rgba
         self.build()
 
     def build(self):
-        self.color_button = Gtk.ColorButton(title="Pick Color")
-        self.color_button.set_sensitive(False)
-        self.set_color(self.color)
-        self.color_button.set_size_request(self.size[0], self.size[1])
+        self.swatch = ColorSwatch(rgba=self.rgba, width_request=self.size[0], height_request=self.size[1])
+        if not self.rgba:
+            self.set_color(self.color)
 
-        self.main_box.append(self.color_button)
+        self.main_box.append(self.swatch)
 
         self.label = Gtk.Label(label=self.name, xalign=Gtk.Align.CENTER, hexpand=False, ellipsize=Pango.EllipsizeMode.END,
                                max_width_chars=20,
@@ -73,31 +124,150 @@ class ColorPreview(AssetPreview):
 
     def set_color(self, color: tuple[int, int, int, int]):
         self.color = color
-        self.color_button.set_rgba(self.get_rgba())
+        self.rgba = color_to_rgba(color)
+        self.swatch.set_rgba(self.rgba)
 
     def set_color_rgba(self, color: Gdk.RGBA):
-        normalized = (color.red * 255,
-                      color.green * 255,
-                      color.blue * 255,
-                      color.alpha * 255)
-        self.color = normalized
-        self.color_button.set_rgba(color)
+        self.color = rgba_to_color(color)
+        self.rgba = color.copy()
+        self.swatch.set_rgba(color)
 
     def get_rgba(self):
-        rgba = Gdk.RGBA()
-        normalized = tuple(color / 255.0 for color in self.color)
-        rgba.red = normalized[0]
-        rgba.green = normalized[1]
-        rgba.blue = normalized[2]
-        rgba.alpha = normalized[3]
-        return rgba
+        return self.rgba.copy()
 
-class Window(AssetManagerWindow):
+class IconCell(AssetCell):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.build()
+
+    def build(self):
+        self.picture = Gtk.Picture(width_request=self.size[0], height_request=self.size[1], overflow=Gtk.Overflow.HIDDEN,
+                                   content_fit=Gtk.ContentFit.COVER,
+                                   hexpand=False, vexpand=False, keep_aspect_ratio=True)
+        self.main_box.append(self.picture)
+
+        self.spinner = Gtk.Spinner(halign=Gtk.Align.CENTER, valign=Gtk.Align.CENTER, visible=False)
+        self.overlay.add_overlay(self.spinner)
+
+        self.label = Gtk.Label(xalign=Gtk.Align.CENTER, hexpand=False, ellipsize=Pango.EllipsizeMode.END,
+                               max_width_chars=20,
+                               margin_start=20, margin_end=20)
+        self.main_box.append(self.label)
+
+    def bind(self, name: str, icon: Icon):
+        super().bind(name, icon)
+        self.label.set_label(name)
+
+        pixbuf = self.window.get_atlas_thumbnail(name)
+        if pixbuf is None:
+            pixbuf = thumbnail_cache.get(name, icon.get_identity(), self.size,
+                                         lambda: scale_to_fit(image2pixbuf(icon.get_rendered()), self.size))
+        self.picture.set_pixbuf(pixbuf)
+        self.set_loading(name in self.window.pending_decodes)
+
+    def unbind(self):
+        super().unbind()
+        self.picture.set_pixbuf(None)
+        self.set_loading(False)
+
+    def set_loading(self, loading: bool):
+        self.spinner.set_visible(loading)
+        self.spinner.set_spinning(loading)
+        self.picture.set_opacity(0.3 if loading else 1.0)
+
+class ColorCell(AssetCell):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.build()
 
-        icon_page, icon_box = self.build_asset_page("Icons", "Select Icons", "image-x-generic-symbolic")
-        color_page, color_box = self.build_asset_page("Colors", "Select Colors", "color-select-symbolic")
+    def build(self):
+        self.swatch = ColorSwatch(width_request=self.size[0], height_request=self.size[1])
+        self.main_box.append(self.swatch)
+
+        self.label = Gtk.Label(xalign=Gtk.Align.CENTER, hexpand=False, ellipsize=Pango.EllipsizeMode.END,
+                               max_width_chars=20,
+                               margin_start=20, margin_end=20)
+        self.main_box.append(self.label)
+
+    def bind(self, name: str, color: Color):
+        super().bind(name, color)
+        self.label.set_label(name)
+
+        self.swatch.set_rgba(floats_to_rgba(color.get_floats()))
+
+class Window(AssetManagerWindow):
+    ICON_PREVIEW_SIZE = (100, 100)
+    # Seconds a single step of the progressive population may take, leaves the rest of the frame to drawing
+    POPULATE_BUDGET = 0.008
+
+    def __init__(self, *args, virtualized: bool = False, use_atlas: bool = False, progressive: bool = False,
+                 palette_view: bool = False, **kwargs):
+        """
+        :param virtualized: Shows the assets in GridViews that only build the visible previews, meant for large asset sets
+        :param use_atlas: Virtualized icon previews show slices of one shared IconAtlas instead of their own thumbnails
+        :param progressive: Shows the window right away and fills the pages in small steps while the main loop is idle,
+                            the visible page first
+        :param palette_view: Draws all colors in a single PaletteView instead of a preview per color
+        """
+        super().__init__(*args, **kwargs)
+
+        thumbnail_cache.watch(self.asset_manager.icons)
+
+        self.virtualized: bool = virtualized
+        self.icon_model: AssetListModel = None
+        self.color_model: AssetListModel = None
+        self.icon_search: AssetSearchModel = None
+        self.color_search: AssetSearchModel = None
+
+        self.icon_atlas: IconAtlas = None
+        self.atlas_version: int = -1
+        self.atlas_pixbuf: GdkPixbuf.Pixbuf = None
+        self.atlas_rects: dict[str, tuple[int, int, int, int]] = {}
+
+        if use_atlas:
+            self.icon_atlas = self.asset_manager.get_icon_atlas(self.ICON_PREVIEW_SIZE)
+
+        # Picked icons get decoded on a worker so large images don't block the UI, maps the asset key to its decode
+        self.decode_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="AssetWindowDecode")
+        self.pending_decodes: dict[str, Future] = {}
+
+        # Previews of the FlowBox pages by asset key, changes of the Managers get applied to them while the window is open
+        self.icon_box: Gtk.FlowBox = None
+        self.color_box: Gtk.FlowBox = None
+        self.palette_view: PaletteView = None
+        self.icon_box_search: FlowBoxSearch = None
+        self.color_box_search: FlowBoxSearch = None
+        self.icon_previews: dict[str, IconPreview] = {}
+        self.color_previews: dict[str, ColorPreview] = {}
+        self.pending_updates: dict[Manager, set[str]] = {}
+        self.update_idle_id: int = 0
+        self.update_lock = threading.Lock()
+
+        self.icon_page: Adw.PreferencesPage = None
+        self.color_page: Adw.PreferencesPage = None
+        self.populate_queues: dict[Manager, deque[str]] = {}
+        self.populate_idle_id: int = 0
+
+        self.connect("close-request", self.on_close_request)
+
+        if virtualized:
+            self.build_virtual_pages()
+            return
+
+        icon_page, icon_box, icon_search_entry = self.build_asset_page("Icons", "Select Icons",
+                                                                       "image-x-generic-symbolic")
+        self.icon_box_search = FlowBoxSearch(icon_box, self.asset_manager.icons)
+        icon_search_entry.connect("search-changed", self.icon_box_search.on_search_changed)
+
+        if palette_view:
+            color_page = self.build_palette_view()
+            color_box = None
+        else:
+            color_page, color_box, color_search_entry = self.build_asset_page("Colors", "Select Colors",
+                                                                              "color-select-symbolic")
+            self.color_box_search = FlowBoxSearch(color_box, self.asset_manager.colors)
+            color_search_entry.connect("search-changed", self.color_box_search.on_search_changed)
+            self.connect_flow_box(color_box, self.on_color_clicked)
 
         icon_page.set_icon_name()
 
@@ -105,36 +275,257 @@ class Window(AssetManagerWindow):
         self.add(color_page)
 
         self.connect_flow_box(icon_box, self.on_icon_clicked)
-        self.connect_flow_box(color_box, self.on_color_clicked)
 
-        self.display_icons(icon_box)
-        self.display_colors(color_box)
+        self.icon_page = icon_page
+        self.color_page = color_page
+        self.icon_box = icon_box
+        self.color_box = color_box
+
+        if progressive:
+            self.start_population()
+        else:
+            self.display_icons(icon_box)
+            if color_box:
+                self.display_colors(color_box)
+
+        # Weak so a window that got closed without removing its listeners doesn't stay alive through the Managers
+        self.asset_manager.icons.add_listener(self.on_icon_event, weak=True)
+        # The PaletteView follows the colors on its own
+        if color_box:
+            self.asset_manager.colors.add_listener(self.on_color_event, weak=True)
+
+    def build_palette_view(self) -> Adw.PreferencesPage:
+        self.palette_view = PaletteView(self.asset_manager.get_palette())
+        self.palette_view.on_activate = self.on_palette_color_activated
+        self.palette_view.on_secondary = self.on_palette_color_reset
+        self.palette_view.watch(self.asset_manager.colors)
+
+        page, search_entry = self.build_palette_page("Colors", "Select Colors", "color-select-symbolic",
+                                                     self.palette_view)
+        search_entry.connect("search-changed", lambda entry: self.palette_view.set_filter(entry.get_text()))
+        return page
+
+    def build_virtual_pages(self):
+        self.icon_model = AssetListModel(self.asset_manager.icons)
+        self.color_model = AssetListModel(self.asset_manager.colors)
+        self.icon_search = AssetSearchModel(self.icon_model)
+        self.color_search = AssetSearchModel(self.color_model)
+
+        icon_page, icon_grid, icon_search_entry = self.build_virtual_asset_page(
+            "Icons", "Select Icons", "image-x-generic-symbolic", self.icon_search.selection, IconCell)
+        color_page, color_grid, color_search_entry = self.build_virtual_asset_page(
+            "Colors", "Select Colors", "color-select-symbolic", self.color_search.selection, ColorCell)
+
+        icon_search_entry.connect("search-changed", self.icon_search.on_search_changed)
+        color_search_entry.connect("search-changed", self.color_search.on_search_changed)
+
+        self.add(icon_page)
+        self.add(color_page)
+
+        icon_grid.connect("activate", self.on_icon_activated)
+        color_grid.connect("activate", self.on_color_activated)
+
+    def get_atlas_thumbnail(self, name: str) -> GdkPixbuf.Pixbuf | None:
+        """
+        Returns the preview of the icon as a slice of the atlas, the slice shares its pixels with the atlas pixbuf
+        """
+        if self.icon_atlas is None:
+            return None
+
+        # The atlas only gets converted again after it changed
+        if self.atlas_version != self.icon_atlas.version:
+            self.atlas_version, image, self.atlas_rects = self.icon_atlas.snapshot()
+            self.atlas_pixbuf = image2pixbuf(image) if image is not None else None
+
+        rect = self.atlas_rects.get(name)
+        if rect is None or self.atlas_pixbuf is None:
+            return None
+        return self.atlas_pixbuf.new_subpixbuf(*rect)
 
     #
     # EVENTS
     #
 
+    def on_close_request(self, *args):
+        for model in (self.icon_model, self.color_model, self.icon_search, self.color_search, self.icon_box_search,
+                      self.color_box_search):
+            if model:
+                model.close()
+
+        self.asset_manager.icons.remove_listener(self.on_icon_event)
+        self.asset_manager.colors.remove_listener(self.on_color_event)
+        self.stop_population()
+        if self.palette_view:
+            self.palette_view.unwatch()
+        with self.update_lock:
+            if self.update_idle_id:
+                GLib.source_remove(self.update_idle_id)
+                self.update_idle_id = 0
+            self.pending_updates.clear()
+
+        for future in self.pending_decodes.values():
+            future.cancel()
+        self.pending_decodes.clear()
+        self.decode_executor.shutdown(wait=False, cancel_futures=True)
+        return False
+
+    # Manager
+
+    def on_icon_event(self, event: ManagerEvent, *args):
+        self.queue_updates(self.asset_manager.icons, event, args)
+
+    def on_color_event(self, event: ManagerEvent, *args):
+        self.queue_updates(self.asset_manager.colors, event, args)
+
+    def queue_updates(self, manager: Manager, event: ManagerEvent, args: tuple):
+        # Listeners may run on worker threads, the previews are only touched on the main loop
+        keys = get_event_keys(event, args)
+
+        with self.update_lock:
+            self.pending_updates.setdefault(manager, set()).update(keys)
+
+            if not self.update_idle_id:
+                self.update_idle_id = GLib.idle_add(self.apply_pending_updates)
+
+    def apply_pending_updates(self):
+        with self.update_lock:
+            pending, self.pending_updates = self.pending_updates, {}
+            self.update_idle_id = 0
+
+        for key in pending.get(self.asset_manager.icons, ()):
+            self.sync_icon_preview(key)
+        for key in pending.get(self.asset_manager.colors, ()):
+            self.sync_color_preview(key)
+
+        # Added assets only show up in the results once the query ran again
+        for search, manager in ((self.icon_box_search, self.asset_manager.icons),
+                                (self.color_box_search, self.asset_manager.colors)):
+            if search and pending.get(manager):
+                search.refresh()
+        return GLib.SOURCE_REMOVE
+
+    def sync_icon_preview(self, name: str):
+        icon = self.asset_manager.icons.get_asset(name)
+        preview = self.icon_previews.get(name)
+
+        if icon is None:
+            if preview:
+                self.icon_box.remove(preview)
+                del self.icon_previews[name]
+        elif preview is None:
+            self.icon_box.append(self.create_icon_preview(name, icon))
+        # A picked icon that is still decoding replaces the preview once it's done
+        elif preview.identity != icon.get_identity() and name not in self.pending_decodes:
+            preview.set_image(icon.get_rendered(), icon.get_identity())
+
+    def sync_color_preview(self, name: str):
+        color = self.asset_manager.colors.get_asset(name)
+        preview = self.color_previews.get(name)
+
+        if color is None:
+            if preview:
+                self.color_box.remove(preview)
+                del self.color_previews[name]
+        elif preview is None:
+            self.color_box.append(self.create_color_preview(name, color))
+        elif tuple(preview.color) != tuple(color.get_values()):
+            preview.set_color(color.get_values())
+
     # Icon
 
+    def on_icon_activated(self, grid_view: Gtk.GridView, position: int):
+        # The item is passed on instead of the cell as cells get reused for other assets while the dialog is open
+        self.on_icon_clicked(grid_view, grid_view.get_model().get_item(position))
+
     def on_icon_clicked(self, flow_box, preview: IconPreview):
         icon_dialog = Gtk.FileDialog.new()
         icon_dialog.set_title("Icon")
 
         icon_dialog.open(self, None, self.on_icon_dialog_response, preview)
 
-    def on_icon_dialog_response(self, dialog: Gtk.FileDialog, task, preview: IconPreview):
+    def on_icon_dialog_response(self, dialog: Gtk.FileDialog, task, preview: IconPreview | AssetItem):
         file = dialog.open_finish(task)
 
         if file:
-            file_path = file.get_path()
-            self.asset_manager.icons.add_override(preview.name, Icon(path=file_path), override=True)
+            self.decode_icon_override(preview, file.get_path())
 
-            _, render = self.asset_manager.icons.get_asset_values(preview.name)
-            preview.set_image(render)
-            self.asset_manager.save()
+    def decode_icon_override(self, preview: IconPreview | AssetItem, file_path: str):
+        """
+        Decodes the picked icon on a worker and adds it as override once it's done.
+        Picking another icon for the same asset before that cancels the pending decode.
+        """
+        name = preview.name
+
+        pending = self.pending_decodes.get(name)
+        if pending:
+            pending.cancel()
+
+        future = self.decode_executor.submit(self._decode_icon, file_path)
+        self.pending_decodes[name] = future
+        self.set_icon_loading(preview, True)
+
+        future.add_done_callback(lambda _: GLib.idle_add(self.on_icon_decoded, preview, future))
+
+    def _decode_icon(self, file_path: str):
+        icon = Icon(path=file_path)
+        icon.attach_render_cache(self.asset_manager.render_cache)
+        render = icon.get_rendered()
+        return icon, render, scale_to_fit(image2pixbuf(render), self.ICON_PREVIEW_SIZE)
+
+    def on_icon_decoded(self, preview: IconPreview | AssetItem, future: Future):
+        # A newer pick replaced this decode or the window got closed
+        if self.pending_decodes.get(preview.name) is not future:
+            return GLib.SOURCE_REMOVE
+
+        del self.pending_decodes[preview.name]
+
+        try:
+            icon, render, thumbnail = future.result()
+        except Exception as e:
+            log.error(f"Could not load icon for {preview.name}: {e}")
+            self.set_icon_loading(preview, False)
+            return GLib.SOURCE_REMOVE
+
+        self.asset_manager.icons.add_override(preview.name, icon, override=True)
+        thumbnail_cache.get(preview.name, icon.get_identity(), self.ICON_PREVIEW_SIZE, lambda: thumbnail)
+
+        # Virtualized pages get updated by their model
+        if isinstance(preview, IconPreview):
+            preview.set_image(render, icon.get_identity())
+        self.set_icon_loading(preview, False)
+
+        self.asset_manager.save()
+        return GLib.SOURCE_REMOVE
+
+    def set_icon_loading(self, preview: IconPreview | AssetItem, loading: bool):
+        if isinstance(preview, IconPreview):
+            preview.set_loading(loading)
+        elif self.icon_model:
+            self.icon_model.refresh(preview.name)
 
     # Color
 
+    def on_color_activated(self, grid_view: Gtk.GridView, position: int):
+        item = grid_view.get_model().get_item(position)
+
+        color_dialog = Gtk.ColorDialog.new()
+        color_dialog.set_title("Color")
+        color_dialog.choose_rgba(self, color_to_rgba(item.asset.get_values()), None, self.on_color_dialog_response, item)
+
+    def on_palette_color_activated(self, palette_view: PaletteView, name: str):
+        color = self.asset_manager.colors.get_asset(name)
+        if color is None:
+            return
+
+        color_dialog = Gtk.ColorDialog.new()
+        color_dialog.set_title("Color")
+        color_dialog.choose_rgba(self, color_to_rgba(color.get_values()), None, self.on_color_dialog_response,
+                                 AssetItem(name, color))
+
+    def on_palette_color_reset(self, palette_view: PaletteView, name: str):
+        self.asset_manager.colors.remove_override(name)
+        self.asset_manager.save()
+
     def on_color_clicked(self, flow_box, preview: ColorPreview):
         color_dialog = Gtk.ColorDialog.new()
         color_dialog.set_title("Color")
@@ -142,10 +533,12 @@ class Window(AssetManagerWindow):
         # Open the dialog
         color_dialog.choose_rgba(self, preview.get_rgba(), None, self.on_color_dialog_response, preview)
 
-    def on_color_dialog_response(self, dialog: Gtk.ColorDialog, task: Gio.Task, preview: ColorPreview):
+    def on_color_dialog_response(self, dialog: Gtk.ColorDialog, task: Gio.Task, preview: ColorPreview | AssetItem):
         rgba = dialog.choose_rgba_finish(task)
-        preview.set_color_rgba(rgba)
-        self.asset_manager.colors.add_override(preview.name, Color(color=preview.color), override=True)
+
+        if isinstance(preview, ColorPreview):
+            preview.set_color_rgba(rgba)
+        self.asset_manager.colors.add_override(preview.name, Color(color=rgba_to_color(rgba)), override=True)
         self.asset_manager.save()
 
     #
@@ -155,28 +548,96 @@ class Window(AssetManagerWindow):
     def display_icons(self, flow_box):
         icons = self.asset_manager.icons.get_assets_merged()
 
-        for name, icon in icons.items():
-            _, render = icon.get_values()
-
-            preview = IconPreview(window=self, name=name, image=render, size=(100, 100), vexpand=False, hexpand=False)
-            flow_box.append(preview)
+        for name, icon in list(icons.items()):
+            flow_box.append(self.create_icon_preview(name, icon))
 
     def display_colors(self, flow_box):
         colors = self.asset_manager.colors.get_assets_merged()
 
-        for name, color in colors.items():
-            color = color.get_values()
-            preview = ColorPreview(window=self, name=name, color=color, size=(100, 100), hexpand=False, vexpand=False)
-            flow_box.append(preview)
+        for name, color in list(colors.items()):
+            flow_box.append(self.create_color_preview(name, color))
+
+    def start_population(self):
+        """
+        Queues the previews of all assets, they get created a few at a time by populate_step
+        """
+        self.stop_population()
+
+        for manager, flow_box in ((self.asset_manager.icons, self.icon_box), (self.asset_manager.colors, self.color_box)):
+            if flow_box:
+                self.populate_queues[manager] = deque(list(manager.get_assets_merged().keys()))
+
+        self.populate_idle_id = GLib.idle_add(self.populate_step)
+
+    def stop_population(self):
+        if self.populate_idle_id:
+            GLib.source_remove(self.populate_idle_id)
+            self.populate_idle_id = 0
+        self.populate_queues.clear()
+
+    def is_populating(self) -> bool:
+        return bool(self.populate_idle_id)
+
+    def populate_step(self):
+        deadline = time.perf_counter() + self.POPULATE_BUDGET
+
+        while time.perf_counter() < deadline:
+            manager = self.get_populate_manager()
+
+            if manager is None:
+                self.populate_idle_id = 0
+                self.populate_queues.clear()
+                return GLib.SOURCE_REMOVE
+
+            name = self.populate_queues[manager].popleft()
+
+            # Creates the preview if the asset still exists and no event created it in the meantime
+            if manager is self.asset_manager.icons:
+                self.sync_icon_preview(name)
+            else:
+                self.sync_color_preview(name)
+
+        return GLib.SOURCE_CONTINUE
+
+    def get_populate_manager(self) -> Manager | None:
+        """
+        Returns the Manager of the page that is shown while it has previews left, the other page gets filled after it
+        """
+        icons, colors = self.asset_manager.icons, self.asset_manager.colors
+        order = (colors, icons) if self.get_visible_page() is self.color_page else (icons, colors)
+
+        for manager in order:
+            if self.populate_queues.get(manager):
+                return manager
+        return None
+
+    def create_icon_preview(self, name: str, icon: Icon) -> IconPreview:
+        preview = IconPreview(window=self, name=name, image=icon.get_rendered(), identity=icon.get_identity(),
+                              size=self.ICON_PREVIEW_SIZE, vexpand=False, hexpand=False)
+        self.icon_previews[name] = preview
+        return preview
+
+    def create_color_preview(self, name: str, color: Color) -> ColorPreview:
+        preview = ColorPreview(window=self, name=name, color=color.get_values(), rgba=floats_to_rgba(color.get_floats()),
+                               size=(100, 100),
+                               hexpand=False, vexpand=False)
+        self.color_previews[name] = preview
+        return preview
 
     def reset_button_clicked(self, *args):
         preview = args[1]
         if type(preview) == IconPreview:
             self.asset_manager.icons.remove_override(preview.name)
-            _, render = self.asset_manager.icons.get_asset(preview.name).get_values()
-            preview.set_image(render)
+            icon = self.asset_manager.icons.get_asset(preview.name)
+            preview.set_image(icon.get_rendered(), icon.get_identity())
             self.asset_manager.save()
         elif type(preview) == ColorPreview:
             self.asset_manager.colors.remove_override(preview.name)
             preview.set_color(self.asset_manager.colors.get_asset(preview.name).get_values())
+            self.asset_manager.save()
+        elif type(preview) == IconCell:
+            self.asset_manager.icons.remove_override(preview.name)
+            self.asset_manager.save()
+        elif type(preview) == ColorCell:
+            self.asset_manager.colors.remove_override(preview.name)
             self.asset_manager.save()
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Hands out one AssetManager per save file to everything in the process that uses it, e.g. every action of a plugin.
+All holders share the same Managers, so changes made by one are seen by all and the save file is only read once.
+"""
+
+import os.path
+import threading
+from contextlib import contextmanager
+
+from .AssetManager import AssetManager
+
+class AssetRegistry:
+    def __init__(self):
+        self._managers: dict[str, AssetManager] = {}
+        self._refs: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._managers)
+
+    def acquire(self, save_path: str, **kwargs) -> AssetManager:
+        """
+        Returns the shared AssetManager of the save file, it gets created and loaded by the first call.
+        Every acquire has to be paired with a release.
+        :param kwargs: Passed on to the AssetManager when it gets created, ignored when it already exists
+        """
+        key = self.get_key(save_path)
+
+        with self._lock:
+            asset_manager = self._managers.get(key)
+            if asset_manager is None:
+                asset_manager = self._managers[key] = AssetManager(save_path, **kwargs)
+                self._refs[key] = 0
+
+            self._refs[key] += 1
+            return asset_manager
+
+    def release(self, asset_manager: AssetManager):
+        """
+        Gives up one reference, the AssetManager gets closed and dropped once nobody holds it anymore
+        """
+        key = self.get_key(asset_manager.save_path)
+
+        with self._lock:
+            if self._managers.get(key) is not asset_manager:
+                return
+
+            self._refs[key] -= 1
+            if self._refs[key] > 0:
+                return
+
+            del self._managers[key]
+            del self._refs[key]
+
+        asset_manager.close()
+
+    @contextmanager
+    def shared(self, save_path: str, **kwargs):
+        """
+        with asset_registry.shared(save_path) as asset_manager:
+            ...
+        """
+        asset_manager = self.acquire(save_path, **kwargs)
+        try:
+            yield asset_manager
+        finally:
+            self.release(asset_manager)
+
+    def get_refs(self, save_path: str) -> int:
+        return self._refs.get(self.get_key(save_path), 0)
+
+    def close(self):
+        """
+        Closes all shared AssetManagers no matter how many holders are left, meant for shutting down
+        """
+        with self._lock:
+            managers = list(self._managers.values())
+            self._managers.clear()
+            self._refs.clear()
+
+        for asset_manager in managers:
+            asset_manager.close()
+
+    @staticmethod
+    def get_key(save_path: str) -> str:
+        return os.path.realpath(save_path)
+
+asset_registry = AssetRegistry()
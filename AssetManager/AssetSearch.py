@@ -0,0 +1,141 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Search index over the keys of a Manager. Keys are indexed by all their 1-3 character substrings so a lookup only has to
+touch the keys sharing grams with the query instead of comparing the query against every key.
+"""
+
+import threading
+
+from .AssetManagerBackend import Manager, ManagerMirror
+
+class SearchIndex(ManagerMirror):
+    GRAM_SIZE = 3
+    # Share of the query trigrams a key needs to contain to count as a fuzzy match
+    FUZZY_THRESHOLD = 0.5
+
+    def __init__(self):
+        self._keys: dict[str, str] = {}  # Key -> lowercase key
+        self._grams: dict[str, set[str]] = {}
+        self._version: int = 0
+        self._lock = threading.RLock()
+
+        # Results of the last query, a query that extends it only has to look at those keys again
+        self._last_query: str = None
+        self._last_version: int = -1
+        self._last_matches: set[str] = set()
+
+        self._manager: Manager = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key: str):
+        with self._lock:
+            if key in self._keys:
+                return
+
+            lowered = key.lower()
+            self._keys[key] = lowered
+            for gram in self._get_grams(lowered):
+                self._grams.setdefault(gram, set()).add(key)
+            self._version += 1
+
+    def remove(self, key: str):
+        with self._lock:
+            lowered = self._keys.pop(key, None)
+            if lowered is None:
+                return
+
+            for gram in self._get_grams(lowered):
+                keys = self._grams.get(gram)
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+            self._version += 1
+
+    def search(self, query: str) -> list[tuple[str, float]]:
+        """
+        Finds the keys matching the query, best matches first
+        :return: Tuples of the key and its score, exact substring matches score above 1, fuzzy matches between 0 and 1
+        """
+        query = query.strip().lower()
+
+        if not query:
+            return [(key, 0.0) for key in self._keys]
+
+        with self._lock:
+            matches = self._find_substring_matches(query)
+            scores = {key: self._score_substring(self._keys[key], query) for key in matches}
+
+            if len(query) > self.GRAM_SIZE:
+                for key, score in self._find_fuzzy_matches(query).items():
+                    scores.setdefault(key, score)
+
+        return sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))
+
+    def _find_substring_matches(self, query: str) -> set[str]:
+        if self._last_query and self._last_version == self._version and query.startswith(self._last_query):
+            matches = {key for key in self._last_matches if query in self._keys[key]}
+        elif len(query) <= self.GRAM_SIZE:
+            matches = set(self._grams.get(query, ()))
+        else:
+            candidates = self._get_candidates(query)
+            matches = {key for key in candidates if query in self._keys[key]}
+
+        self._last_query = query
+        self._last_version = self._version
+        self._last_matches = matches
+        return matches
+
+    def _get_candidates(self, query: str) -> set[str]:
+        trigrams = self._get_trigrams(query)
+        postings = sorted((self._grams.get(gram, set()) for gram in trigrams), key=len)
+        if not postings:
+            return set()
+
+        # Starting with the rarest trigram keeps the intersection small
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return candidates
+
+    def _find_fuzzy_matches(self, query: str) -> dict[str, float]:
+        trigrams = self._get_trigrams(query)
+        counts: dict[str, int] = {}
+
+        for gram in trigrams:
+            for key in self._grams.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+
+        required = len(trigrams) * self.FUZZY_THRESHOLD
+        return {key: count / (len(trigrams) + 1) for key, count in counts.items() if count >= required}
+
+    @staticmethod
+    def _score_substring(key: str, query: str) -> float:
+        score = 1.0 + len(query) / len(key)
+        if key.startswith(query):
+            score += 1.0
+        if key == query:
+            score += 1.0
+        return score
+
+    def _get_grams(self, text: str) -> set[str]:
+        return {text[i:i + size] for size in range(1, self.GRAM_SIZE + 1) for i in range(len(text) - size + 1)}
+
+    def _get_trigrams(self, text: str) -> set[str]:
+        return {text[i:i + self.GRAM_SIZE] for i in range(len(text) - self.GRAM_SIZE + 1)}
+
+    #
+    # MANAGER
+    #
+
+    def sync(self, manager: Manager, keys):
+        for key in keys:
+            if manager.get_asset(key) is None:
+                self.remove(key)
+            else:
+                self.add(key)
@@ -0,0 +1,190 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Watches the files of all icons in a Manager and reloads icons whose file changed on disk, so icon packs can be edited
+while StreamController is running. Reloaded icons are reported with a CHANGE or OVERRIDE_CHANGE event each, or in a
+single BATCH event per check when batching is enabled.
+
+Uses inotify through the optional inotify_simple package when it's installed and falls back to polling the files with
+os.stat otherwise.
+"""
+
+import os
+import threading
+from contextlib import nullcontext
+
+from .AssetManagerBackend import Manager, ManagerEvent
+
+from loguru import logger as log
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+    inotify_flags = None
+
+class AssetWatcher:
+    BACKEND_AUTO = "auto"
+    BACKEND_POLL = "poll"
+    BACKEND_INOTIFY = "inotify"
+
+    def __init__(self, manager: Manager, interval: float = 1.0, backend: str = BACKEND_AUTO, batch: bool = False):
+        """
+        :param manager: Manager whose assets and overrides get watched, the assets need a get_path method like Icon
+        :param interval: Seconds between two polls, with inotify changes get collected for that long before reloading
+        :param backend: "poll", "inotify" or "auto" to use inotify when inotify_simple is installed
+        :param batch: Reports all icons reloaded by one check in a single BATCH event instead of one event per icon
+        """
+        if backend == self.BACKEND_AUTO:
+            backend = self.BACKEND_INOTIFY if INotify else self.BACKEND_POLL
+        if backend == self.BACKEND_INOTIFY and INotify is None:
+            raise ImportError("The inotify backend needs the inotify_simple package")
+
+        self.manager: Manager = manager
+        self.interval: float = interval
+        self.backend: str = backend
+        self.batch: bool = batch
+
+        # Path -> (key, is_override) of every asset showing that file
+        self._watched: dict[str, list[tuple[str, bool]]] = {}
+        self._watched_dirty: bool = True
+        self._lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+        self._inotify = None
+        self._watch_descriptors: dict[int, str] = {}
+
+    def start(self):
+        if self._thread:
+            return
+
+        self._stop_event.clear()
+        self.manager.add_listener(self.on_manager_event, events=[ManagerEvent.ADD, ManagerEvent.REMOVE,
+                                                                 ManagerEvent.OVERRIDE_ADD, ManagerEvent.OVERRIDE_REMOVE,
+                                                                 ManagerEvent.BATCH])
+
+        target = self._run_inotify if self.backend == self.BACKEND_INOTIFY else self._run_poll
+        self._thread = threading.Thread(target=target, name="AssetWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+
+        self.manager.remove_listener(self.on_manager_event)
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def on_manager_event(self, *args):
+        with self._lock:
+            self._watched_dirty = True
+
+    #
+    # CHECKING
+    #
+
+    def check(self, paths: set[str] = None) -> int:
+        """
+        Reloads every icon whose file changed since it was loaded
+        :param paths: Only checks these paths, all watched paths when not set
+        :return: The amount of reloaded assets
+        """
+        watched = self._get_watched()
+        reloaded = 0
+
+        # One save in an editor can touch many files, with batch listeners get a single BATCH event for all of them
+        with self.manager.batch() if self.batch else nullcontext():
+            for path in (watched if paths is None else paths & watched.keys()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Files that are being replaced are picked up once they exist again
+
+                for key, override in watched[path]:
+                    asset = self.manager.get_asset(key, skip_override=not override)
+                    if asset is None or self._is_current(asset, stat):
+                        continue
+
+                    if override:
+                        self.manager.change_override(key, path=asset.get_path())
+                    else:
+                        self.manager.change_asset(key, path=asset.get_path())
+                    reloaded += 1
+
+        return reloaded
+
+    @staticmethod
+    def _is_current(asset, stat: os.stat_result) -> bool:
+        identity = asset.get_identity()
+        return identity is not None and identity[1:] == (stat.st_mtime_ns, stat.st_size)
+
+    def _get_watched(self) -> dict[str, list[tuple[str, bool]]]:
+        with self._lock:
+            if not self._watched_dirty:
+                return self._watched
+            self._watched_dirty = False
+
+        watched = {}
+        for override, assets in ((False, self.manager.get_assets()), (True, self.manager.get_overrides())):
+            for key, asset in list(assets.items()):
+                path = asset.get_path() if hasattr(asset, "get_path") else None
+                if path:
+                    watched.setdefault(os.path.abspath(path), []).append((key, override))
+
+        self._watched = watched
+        if self._inotify:
+            self._update_inotify_watches()
+        return watched
+
+    #
+    # BACKENDS
+    #
+
+    def _run_poll(self):
+        while not self._stop_event.wait(self.interval):
+            self._safe_check()
+
+    def _run_inotify(self):
+        self._inotify = INotify()
+        self._get_watched()
+        self._update_inotify_watches()
+
+        try:
+            while not self._stop_event.is_set():
+                # Events of one interval are collected into one check so a save that touches a file several times
+                # only reloads it once
+                changed = set()
+                for event in self._inotify.read(timeout=int(self.interval * 1000), read_delay=50):
+                    directory = self._watch_descriptors.get(event.wd)
+                    if directory and event.name:
+                        changed.add(os.path.join(directory, event.name))
+
+                if changed or self._watched_dirty:
+                    self._safe_check(changed)
+        finally:
+            self._inotify.close()
+            self._inotify = None
+            self._watch_descriptors.clear()
+
+    def _update_inotify_watches(self):
+        # Directories are watched instead of the files, editors often replace a file instead of writing into it
+        directories = {os.path.dirname(path) for path in self._watched}
+        mask = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE | inotify_flags.ATTRIB
+
+        for directory in directories - set(self._watch_descriptors.values()):
+            try:
+                self._watch_descriptors[self._inotify.add_watch(directory, mask)] = directory
+            except OSError as e:
+                log.warning(f"Could not watch {directory}: {e}")
+
+    def _safe_check(self, paths: set[str] = None):
+        try:
+            self.check(paths)
+        except Exception as e:
+            log.error(f"Checking for changed assets failed: {e}")
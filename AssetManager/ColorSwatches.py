@@ -0,0 +1,311 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Widgets that paint colors directly instead of using a Gtk.ColorButton per color. ColorSwatch is a single cheap swatch
+for the previews, PaletteView draws a whole Palette on one surface and maps clicks back to the color keys.
+"""
+
+import threading
+
+import gi
+
+gi.require_version("Gtk", "4.0")
+gi.require_version("Graphene", "1.0")
+from gi.repository import Gdk, GLib, GObject, Graphene, Gtk
+
+from .AssetManagerBackend import Manager, ManagerEvent, get_event_keys
+from .Palette import Palette
+
+CHECKER_SIZE = 8
+CHECKER_LIGHT = (0.8, 0.8, 0.8)
+CHECKER_DARK = (0.6, 0.6, 0.6)
+
+def create_rgba(red: float, green: float, blue: float, alpha: float = 1.0) -> Gdk.RGBA:
+    rgba = Gdk.RGBA()
+    rgba.red, rgba.green, rgba.blue, rgba.alpha = red, green, blue, alpha
+    return rgba
+
+class ColorSwatch(Gtk.Widget):
+    """
+    Paints a single color, translucent colors are shown over a checkerboard like Gtk.ColorButton does
+    """
+    __gtype_name__ = "AssetManagerColorSwatch"
+
+    def __init__(self, rgba: Gdk.RGBA = None, **kwargs):
+        super().__init__(**kwargs)
+        self.set_overflow(Gtk.Overflow.HIDDEN)
+        self.add_css_class("card")
+
+        self.rgba: Gdk.RGBA = rgba or create_rgba(0, 0, 0, 0)
+
+    def set_rgba(self, rgba: Gdk.RGBA):
+        self.rgba = rgba.copy()
+        self.queue_draw()
+
+    def get_rgba(self) -> Gdk.RGBA:
+        return self.rgba.copy()
+
+    def do_snapshot(self, snapshot: Gtk.Snapshot):
+        width, height = self.get_width(), self.get_height()
+
+        if self.rgba.alpha < 1.0:
+            light, dark = create_rgba(*CHECKER_LIGHT), create_rgba(*CHECKER_DARK)
+            snapshot.append_color(light, Graphene.Rect().init(0, 0, width, height))
+
+            for y in range(0, height, CHECKER_SIZE):
+                for x in range((y // CHECKER_SIZE) % 2 * CHECKER_SIZE, width, CHECKER_SIZE * 2):
+                    snapshot.append_color(dark, Graphene.Rect().init(x, y, CHECKER_SIZE, CHECKER_SIZE))
+
+        snapshot.append_color(self.rgba, Graphene.Rect().init(0, 0, width, height))
+
+class PaletteView(Gtk.DrawingArea, Gtk.Scrollable):
+    """
+    Draws the colors of a Palette as a grid of swatches on a single surface, clicks and tooltips get mapped back to the
+    key of the swatch under the pointer. Inside of a Gtk.ScrolledWindow the view is only as large as the visible area
+    and paints the rows at the scroll offset, outside of one it grows to fit and paints all rows.
+    """
+    __gtype_name__ = "AssetManagerPaletteView"
+
+    hscroll_policy = GObject.Property(type=Gtk.ScrollablePolicy, default=Gtk.ScrollablePolicy.MINIMUM)
+    vscroll_policy = GObject.Property(type=Gtk.ScrollablePolicy, default=Gtk.ScrollablePolicy.MINIMUM)
+
+    # Height of all rows, the view scrolls through it inside of a ScrolledWindow
+    rows_height: int = 1
+
+    # Set by the ScrolledWindow, can be set before __init__ ran
+    _hadjustment: Gtk.Adjustment = None
+    _vadjustment: Gtk.Adjustment = None
+    _vadjustment_handler: int = 0
+
+    def __init__(self, palette: Palette, swatch_size: int = 48, spacing: int = 6, **kwargs):
+        super().__init__(hexpand=True, has_tooltip=True, **kwargs)
+        self.palette: Palette = palette
+        self.swatch_size: int = swatch_size
+        self.spacing: int = spacing
+
+        self.query: str = ""
+        self.keys: list[str] = []
+        self.columns: int = 1
+
+        # Called with the key of a swatch on a primary or secondary click
+        self.on_activate: callable = None
+        self.on_secondary: callable = None
+
+        self._manager: Manager = None
+        self._redraw_id: int = 0
+        self._lock = threading.Lock()
+
+        self.set_draw_func(self.on_draw)
+        self.connect("resize", self.on_resize)
+        self.connect("query-tooltip", self.on_query_tooltip)
+
+        click = Gtk.GestureClick(button=0)
+        click.connect("released", self.on_click_released)
+        self.add_controller(click)
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Updates the shown keys after colors got added, removed or the filter changed and redraws the view
+        """
+        keys = self.palette.keys()
+        if self.query:
+            keys = [key for key in keys if self.query in key.lower()]
+
+        self.keys = keys
+        self.update_height()
+        self.queue_draw()
+
+    def set_filter(self, query: str):
+        self.query = query.strip().lower()
+        self.refresh()
+
+    def get_key_at(self, x: float, y: float) -> str | None:
+        """
+        Returns the key of the swatch at the position or None when the position is between or outside the swatches
+        :param y: Position inside of the widget, the scroll offset gets added on top
+        """
+        step = self.swatch_size + self.spacing
+        y += self.get_offset()
+        column, column_offset = divmod(int(x), step)
+        row, row_offset = divmod(int(y), step)
+
+        if x < 0 or y < 0 or column >= self.columns or column_offset >= self.swatch_size or row_offset >= self.swatch_size:
+            return None
+
+        index = row * self.columns + column
+        return self.keys[index] if index < len(self.keys) else None
+
+    def update_height(self):
+        self.rows_height = self.get_rows_height()
+
+        if self._vadjustment is None:
+            self.set_content_height(self.rows_height)
+        self.update_adjustments()
+
+    def get_rows_height(self) -> int:
+        rows = -(-len(self.keys) // self.columns)
+        return max(1, rows * (self.swatch_size + self.spacing))
+
+    def get_offset(self) -> float:
+        """
+        Returns how far the view is scrolled down, 0 outside of a ScrolledWindow
+        """
+        return self._vadjustment.get_value() if self._vadjustment else 0
+
+    #
+    # SCROLLING
+    #
+
+    @GObject.Property(type=Gtk.Adjustment)
+    def hadjustment(self) -> Gtk.Adjustment:
+        return self._hadjustment
+
+    @hadjustment.setter
+    def hadjustment(self, adjustment: Gtk.Adjustment):
+        self._hadjustment = adjustment
+        self.update_adjustments()
+
+    @GObject.Property(type=Gtk.Adjustment)
+    def vadjustment(self) -> Gtk.Adjustment:
+        return self._vadjustment
+
+    @vadjustment.setter
+    def vadjustment(self, adjustment: Gtk.Adjustment):
+        if self._vadjustment_handler:
+            self._vadjustment.disconnect(self._vadjustment_handler)
+            self._vadjustment_handler = 0
+
+        self._vadjustment = adjustment
+        if adjustment:
+            self._vadjustment_handler = adjustment.connect("value-changed", lambda _: self.queue_draw())
+            # The ScrolledWindow sizes the view to the visible area, the rows are scrolled through the adjustment
+            self.set_content_height(0)
+        self.update_adjustments()
+
+    def update_adjustments(self):
+        """
+        Sets the range of the adjustments to the rows of the palette and the page to the visible area
+        """
+        width, height = self.get_width(), self.get_height()
+
+        if self._hadjustment:
+            self._hadjustment.configure(0, 0, width, width * 0.1, width * 0.9, width)
+
+        if self._vadjustment:
+            upper = max(self.rows_height, height)
+            value = min(self._vadjustment.get_value(), upper - height)
+            self._vadjustment.configure(value, 0, upper, self.swatch_size + self.spacing, height * 0.9, height)
+
+    #
+    # DRAWING
+    #
+
+    def on_resize(self, area, width: int, height: int):
+        columns = max(1, (width + self.spacing) // (self.swatch_size + self.spacing))
+
+        if columns != self.columns:
+            self.columns = columns
+            if self._vadjustment is None:
+                # Changing the height from inside of resize would start another allocation right away
+                GLib.idle_add(self.update_height)
+                return
+            self.rows_height = self.get_rows_height()
+        self.update_adjustments()
+
+    def on_draw(self, area, cr, width: int, height: int):
+        step = self.swatch_size + self.spacing
+        offset = self.get_offset()
+
+        first_row = int(offset) // step
+        last_row = int(offset + height) // step
+
+        keys = self.keys
+
+        for row in range(first_row, last_row + 1):
+            for column in range(self.columns):
+                index = row * self.columns + column
+                if index >= len(keys):
+                    return
+
+                values = self.palette.get_floats(keys[index])
+                if values is None:
+                    continue
+
+                x, y = column * step, row * step - offset
+
+                if values[3] < 1.0:
+                    cr.set_source_rgb(*CHECKER_LIGHT)
+                    cr.rectangle(x, y, self.swatch_size, self.swatch_size)
+                    cr.fill()
+                    cr.set_source_rgb(*CHECKER_DARK)
+                    half = self.swatch_size / 2
+                    cr.rectangle(x, y, half, half)
+                    cr.rectangle(x + half, y + half, half, half)
+                    cr.fill()
+
+                cr.set_source_rgba(*values)
+                cr.rectangle(x, y, self.swatch_size, self.swatch_size)
+                cr.fill()
+
+    #
+    # EVENTS
+    #
+
+    def on_click_released(self, gesture: Gtk.GestureClick, n_press: int, x: float, y: float):
+        key = self.get_key_at(x, y)
+        if key is None:
+            return
+
+        callback = self.on_secondary if gesture.get_current_button() == Gdk.BUTTON_SECONDARY else self.on_activate
+        if callback:
+            callback(self, key)
+
+    def on_query_tooltip(self, widget, x: int, y: int, keyboard_mode: bool, tooltip: Gtk.Tooltip) -> bool:
+        key = self.get_key_at(x, y)
+        if key is None:
+            return False
+
+        tooltip.set_text(key)
+        return True
+
+    #
+    # MANAGER
+    #
+
+    def watch(self, manager: Manager):
+        """
+        Redraws the view when colors of the Manager change
+        """
+        self._manager = manager
+        manager.add_listener(self.on_manager_event, weak=True)
+
+    def unwatch(self):
+        if self._manager:
+            self._manager.remove_listener(self.on_manager_event)
+            self._manager = None
+
+        with self._lock:
+            if self._redraw_id:
+                GLib.source_remove(self._redraw_id)
+                self._redraw_id = 0
+
+    def on_manager_event(self, event: ManagerEvent, *args):
+        keys = get_event_keys(event, args)
+
+        # The listener of the palette may still be running on another worker, syncing the keys here as well makes sure
+        # the palette is up to date before the redraw
+        self.palette.sync(self._manager, keys)
+
+        with self._lock:
+            if not self._redraw_id:
+                self._redraw_id = GLib.idle_add(self._apply_redraw)
+
+    def _apply_redraw(self):
+        with self._lock:
+            self._redraw_id = 0
+
+        self.refresh()
+        return GLib.SOURCE_REMOVE
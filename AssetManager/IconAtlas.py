@@ -0,0 +1,198 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Packs the rendered icons of a Manager into one shared image. Every icon gets scaled to fit a cell of the atlas size and
+is found through a key to rect index, so previews and renderers can use slices of a single image instead of holding
+their own copy of every icon.
+"""
+
+import math
+import threading
+
+from PIL import Image
+from loguru import logger as log
+
+from .AssetManagerBackend import Manager, ManagerMirror
+
+class IconAtlas(ManagerMirror):
+    def __init__(self, cell_size: tuple[int, int], columns: int = 16, padding: int = 1):
+        """
+        :param cell_size: Size every icon gets scaled to fit in
+        :param columns: Cells per row, the atlas grows by adding rows
+        :param padding: Empty pixels between cells, keeps filtering from bleeding into neighbouring icons
+        """
+        self.cell_size: tuple[int, int] = tuple(cell_size)
+        self.columns: int = columns
+        self.padding: int = padding
+
+        self.image: Image.Image = None
+        self.version: int = 0
+
+        self._slots: dict[str, int] = {}
+        self._rects: dict[str, tuple[int, int, int, int]] = {}
+        self._identities: dict[str, tuple] = {}
+        self._free_slots: list[int] = []
+        self._capacity: int = 0
+        self._lock = threading.RLock()
+
+        self._manager: Manager = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key: str):
+        return key in self._slots
+
+    def get_rect(self, key: str) -> tuple[int, int, int, int] | None:
+        """
+        Returns the x, y, width and height of the icon inside the atlas image
+        """
+        return self._rects.get(key, None)
+
+    def get_rects(self) -> dict[str, tuple[int, int, int, int]]:
+        with self._lock:
+            return dict(self._rects)
+
+    def get_image(self) -> Image.Image | None:
+        """
+        Returns the atlas image, it gets modified in place on updates so check version before reusing a converted copy
+        """
+        return self.image
+
+    def snapshot(self) -> tuple[int, Image.Image | None, dict[str, tuple[int, int, int, int]]]:
+        """
+        Returns the version, a copy of the image and the rects at that version, safe to use while the atlas gets updated
+        """
+        with self._lock:
+            image = self.image.copy() if self.image is not None else None
+            return self.version, image, dict(self._rects)
+
+    def crop(self, key: str) -> Image.Image | None:
+        """
+        Returns a copy of the icon cut out of the atlas
+        """
+        with self._lock:
+            rect = self._rects.get(key)
+            if rect is None:
+                return None
+
+            x, y, width, height = rect
+            return self.image.crop((x, y, x + width, y + height))
+
+    #
+    # PACKING
+    #
+
+    def update(self, key: str, image: Image.Image, identity: tuple = None):
+        """
+        Scales the image into the cell of the key, only the cell gets redrawn
+        :param identity: Skips the update if the key already shows an image with this identity
+        """
+        if image is None:
+            self.remove(key)
+            return
+
+        with self._lock:
+            if identity is not None and self._identities.get(key) == identity:
+                return
+
+            thumbnail = image.convert("RGBA")
+            thumbnail.thumbnail(self.cell_size)
+
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._allocate()
+                self._slots[key] = slot
+
+            cell_x, cell_y = self._get_cell_origin(slot)
+            self._clear_cell(slot)
+
+            # Centered in the cell like the previews of the window
+            x = cell_x + (self.cell_size[0] - thumbnail.width) // 2
+            y = cell_y + (self.cell_size[1] - thumbnail.height) // 2
+            self.image.paste(thumbnail, (x, y))
+
+            self._rects[key] = (x, y, thumbnail.width, thumbnail.height)
+            self._identities[key] = identity
+            self.version += 1
+
+    def remove(self, key: str):
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                return
+
+            self._clear_cell(slot)
+            self._free_slots.append(slot)
+            del self._rects[key]
+            self._identities.pop(key, None)
+            self.version += 1
+
+    def clear(self):
+        with self._lock:
+            self.image = None
+            self._slots.clear()
+            self._rects.clear()
+            self._identities.clear()
+            self._free_slots.clear()
+            self._capacity = 0
+            self.version += 1
+
+    def _allocate(self) -> int:
+        if self._free_slots:
+            return self._free_slots.pop()
+
+        slot = len(self._slots)
+        if slot >= self._capacity:
+            self._grow(max(self.columns, self._capacity * 2))
+        return slot
+
+    def _grow(self, capacity: int):
+        rows = math.ceil(capacity / self.columns)
+        width = self.columns * (self.cell_size[0] + self.padding)
+        height = rows * (self.cell_size[1] + self.padding)
+
+        # Existing cells keep their position, so the rects stay valid
+        image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        if self.image is not None:
+            image.paste(self.image, (0, 0))
+
+        self.image = image
+        self._capacity = rows * self.columns
+
+    def _get_cell_origin(self, slot: int) -> tuple[int, int]:
+        row, column = divmod(slot, self.columns)
+        return column * (self.cell_size[0] + self.padding), row * (self.cell_size[1] + self.padding)
+
+    def _clear_cell(self, slot: int):
+        x, y = self._get_cell_origin(slot)
+        self.image.paste((0, 0, 0, 0), (x, y, x + self.cell_size[0], y + self.cell_size[1]))
+
+    #
+    # MANAGER
+    #
+
+    def sync(self, manager: Manager, keys):
+        """
+        Brings the cells of the keys in line with the Manager, icons only get scaled again if their file changed
+        """
+        for key in keys:
+            self.sync_key(manager, key)
+
+    def sync_key(self, manager: Manager, key: str):
+        icon = manager.get_asset(key)
+
+        if icon is None:
+            self.remove(key)
+            return
+
+        identity = icon.get_identity()
+        if identity is not None and self._identities.get(key) == identity:
+            return
+
+        try:
+            self.update(key, icon.get_rendered(), identity)
+        except Exception as e:
+            log.error(f"Could not add {key} to the icon atlas: {e}")
+            self.remove(key)
@@ -0,0 +1,443 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Caches used by the assets to keep decoded media around only as long as it's actually needed.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import weakref
+from collections import OrderedDict
+
+from PIL import Image
+
+from loguru import logger as log
+
+def estimate_image_bytes(image) -> int:
+    """
+    Estimates the memory an image holds, objects that don't look like an image count as 0
+    """
+    try:
+        return image.width * image.height * len(image.getbands())
+    except (AttributeError, TypeError):
+        return 0
+
+def estimate_media_bytes(media, depth: int = 3) -> int:
+    """
+    Estimates the memory of a decoded Media by adding up every image it holds, including the frames of animations.
+    The Media gets searched for images in its attributes and in lists, tuples and dicts of them, e.g. layers or frames.
+    """
+    if media is None or depth < 0:
+        return 0
+
+    size = estimate_image_bytes(media)
+    if size:
+        return size
+
+    if isinstance(media, (list, tuple, set)):
+        return sum(estimate_media_bytes(value, depth - 1) for value in media)
+    if isinstance(media, dict):
+        return sum(estimate_media_bytes(value, depth - 1) for value in media.values())
+
+    try:
+        attributes = vars(media)
+    except TypeError:
+        return 0
+    return sum(estimate_media_bytes(value, depth - 1) for value in attributes.values())
+
+class LRUCache:
+    def __init__(self, max_items: int = None, max_bytes: int = None, size_of: callable = None,
+                 on_evict: callable = None):
+        """
+        Least recently used cache that is bounded by entry count and by the size of the stored values
+        :param max_items: Maximum amount of entries, None means unbounded
+        :param max_bytes: Maximum summed size of all entries, None means unbounded
+        :param size_of: Returns the size of a value in bytes, only needed when using max_bytes
+        :param on_evict: Called with the key of every entry dropped to stay within the limits, while holding the lock
+        """
+        self.max_items: int = max_items
+        self.max_bytes: int = max_bytes
+        self.size_of: callable = size_of or (lambda value: 0)
+        self.on_evict: callable = on_evict
+
+        self._entries: OrderedDict = OrderedDict()
+        self._sizes: dict = {}
+        self._bytes: int = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def configure(self, max_items: int = None, max_bytes: int = None):
+        with self._lock:
+            self.max_items = max_items
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        size = self.size_of(value)
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            self._evict(keep=key)
+
+    def get_or_load(self, key, loader: callable):
+        """
+        Returns the cached value or calls the loader and caches its result.
+        The loader is called outside the lock so slow decodes don't block other lookups.
+        """
+        value = self.get(key, self)
+        if value is not self:
+            return value
+
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def remove(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def pop(self, key, default=None):
+        """
+        Removes the entry and returns its value
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries[key]
+            self._discard(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def _discard(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self._bytes -= self._sizes.pop(key)
+
+    def _evict(self, keep=None):
+        while self._entries and self._over_limit():
+            oldest = next(iter(self._entries))
+
+            # The newest entry stays even if it alone exceeds the limit, it's about to be used
+            if oldest == keep:
+                break
+            self._discard(oldest)
+
+            if self.on_evict:
+                self.on_evict(oldest)
+
+    def _over_limit(self) -> bool:
+        if self.max_items is not None and len(self._entries) > self.max_items:
+            return True
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            return True
+        return False
+
+class InternEntry:
+    __slots__ = ("refs", "value", "size", "lock")
+
+    def __init__(self):
+        self.refs: int = 0
+        self.value = None
+        self.size: int = 0
+        self.lock = threading.Lock()
+
+class InternTable:
+    def __init__(self, size_of: callable = None, on_release: callable = None):
+        """
+        Shares one value between everything referencing the same key, e.g. all icons showing the same file.
+        Values are loaded once on first use and kept as long as the key is acquired, concurrent loads of the same key
+        are only done once. The entry is dropped with the last reference.
+        :param size_of: Returns the size of a value in bytes, the sizes of all held values add up to bytes
+        :param on_release: Called with the key and the value when the last reference got released, e.g. to keep the
+                           value around in an LRUCache in case the key gets acquired again
+        """
+        self.size_of: callable = size_of or (lambda value: 0)
+        self.on_release: callable = on_release
+
+        self._entries: dict = {}
+        self._bytes: int = 0
+        # Released from finalizers, which can run while the same thread already holds the lock
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def acquire(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = InternEntry()
+            entry.refs += 1
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+
+            del self._entries[key]
+            self._bytes -= entry.size
+
+        if entry.value is not None and self.on_release:
+            self.on_release(key, entry.value)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry.value is None:
+            return default
+        return entry.value
+
+    def get_refs(self, key) -> int:
+        entry = self._entries.get(key)
+        return entry.refs if entry else 0
+
+    def get_or_load(self, key, loader: callable):
+        """
+        Returns the shared value or calls the loader once, other threads asking for the same key wait for that load.
+        Keys that nobody acquired aren't stored and get loaded on every call.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return loader()
+
+        value = entry.value
+        if value is not None:
+            return value
+
+        with entry.lock:
+            if entry.value is None:
+                self._store(key, entry, loader())
+            return entry.value
+
+    def set(self, key, value) -> bool:
+        """
+        Replaces the shared value
+        :return: False for keys that nobody acquired, the value isn't stored then
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+
+        self._store(key, entry, value)
+        return True
+
+    def clear_values(self):
+        """
+        Drops the loaded values but keeps the references, they get loaded again on their next use
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                entry.value = None
+                entry.size = 0
+            self._bytes = 0
+
+    def _store(self, key, entry: InternEntry, value):
+        size = self.size_of(value) if value is not None else 0
+
+        with self._lock:
+            # Entries released in the meantime don't count towards bytes anymore
+            if self._entries.get(key) is entry:
+                self._bytes += size - entry.size
+            entry.value = value
+            entry.size = size
+
+class RenderCache:
+    FORMAT_VERSION = 1
+    MAGIC = b"SCRC"
+    SUFFIX = ".render"
+
+    # One cache per directory, so AssetManagers with save files in the same directory don't prune each other
+    _shared: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Keeps rendered images on disk so they don't have to be decoded again on the next start.
+        Entries are keyed by the source file, its modification time and size and the render parameters, so changed
+        files never hit an old entry. Old entries get removed once the cache grows above max_bytes.
+        :param directory: Directory the rendered images are stored in, gets created when needed
+        :param max_bytes: Maximum size of all entries on disk, None means unbounded
+        """
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+
+        self._bytes: int = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_shared(cls, directory: str) -> "RenderCache":
+        """
+        Returns the cache of the directory, it gets created if nothing holds one for it yet
+        """
+        key = os.path.realpath(directory)
+
+        with cls._shared_lock:
+            render_cache = cls._shared.get(key)
+            if render_cache is None:
+                render_cache = cls._shared[key] = cls(directory)
+            return render_cache
+
+    def get_key(self, path: str, params: tuple = ()) -> str | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        identity = repr((self.FORMAT_VERSION, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, params))
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def get(self, path: str, params: tuple = ()):
+        """
+        :return: The rendered image stored for the file or None if there is no up-to-date entry
+        """
+        key = self.get_key(path, params)
+        if not key:
+            return None
+
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path, "rb") as file:
+                data = file.read()
+            os.utime(entry_path)  # Pruning removes the least recently used entries first
+        except OSError:
+            return None
+
+        try:
+            if data[:4] != self.MAGIC:
+                return None
+
+            header_length = struct.unpack_from("<I", data, 4)[0]
+            header = json.loads(data[8:8 + header_length])
+            return Image.frombytes(header["mode"], tuple(header["size"]), data[8 + header_length:])
+        except (ValueError, KeyError, struct.error):
+            self._remove_entry(key)
+            return None
+
+    def put(self, path: str, image, params: tuple = ()):
+        key = self.get_key(path, params)
+        if not key or image is None:
+            return
+
+        header = json.dumps({"mode": image.mode, "size": list(image.size)}).encode()
+        data = self.MAGIC + struct.pack("<I", len(header)) + header + image.tobytes()
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entry_path = self._get_entry_path(key)
+            temp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+            old_size = os.path.getsize(entry_path) if os.path.isfile(entry_path) else 0
+
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            log.warning(f"Could not write render cache entry for {path}: {e}")
+            return
+
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(data) - old_size
+        self.prune()
+
+    def prune(self):
+        """
+        Removes the least recently used entries until the cache is below max_bytes again
+        """
+        if self.max_bytes is None:
+            return
+
+        with self._lock:
+            if self._get_size() <= self.max_bytes:
+                return
+
+            entries = sorted(self._scan(), key=lambda entry: entry[1])
+            for entry_path, _, size in entries:
+                if self._bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(entry_path)
+                    self._bytes -= size
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            for entry_path, _, _ in self._scan():
+                try:
+                    os.remove(entry_path)
+                except OSError:
+                    pass
+            self._bytes = 0
+
+    def _get_entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _remove_entry(self, key: str):
+        try:
+            os.remove(self._get_entry_path(key))
+        except OSError:
+            pass
+        with self._lock:
+            self._bytes = None
+
+    def _get_size(self) -> int:
+        if self._bytes is None:
+            self._bytes = sum(size for _, _, size in self._scan())
+        return self._bytes
+
+    def _scan(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if not name.endswith(self.SUFFIX):
+                continue
+            entry_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((entry_path, stat.st_mtime_ns, stat.st_size))
+        return entries
@@ -4,34 +4,332 @@ Year: 2024
 """
 
 import asyncio
+import enum
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
 
-class Observer:
+from .ObserverStats import ObserverStats, get_callback_name
+
+from loguru import logger as log
+
+class DispatchMode(enum.Enum):
+    SYNC = "sync"                        # Callbacks run one after another on the notifying thread
+    THREADED = "threaded"                # Callbacks run on the worker pool, notify waits for all of them
+    FIRE_AND_FORGET = "fire_and_forget"  # Callbacks run on the worker pool, notify returns immediately
+
+class WeakCallback:
+    """
+    Holds a bound method without keeping its object alive, resolves to None once the object got collected
+    """
+    def __init__(self, method, on_dead: callable):
+        self.key: tuple[int, int] = WeakCallback.get_key(method)
+        self.name: str = get_callback_name(method)
+        self._method = weakref.WeakMethod(method, lambda _: on_dead(self))
+
+    def resolve(self) -> callable:
+        return self._method()
+
+    def matches(self, method) -> bool:
+        # Compared by identity as the ids in the key can be reused once the object got collected
+        resolved = self._method()
+        return resolved is not None and resolved.__self__ is method.__self__ and resolved.__func__ is method.__func__
+
+    @staticmethod
+    def get_key(method) -> tuple[int, int]:
+        return id(method.__self__), id(method.__func__)
+
+    @staticmethod
+    def supports(callback: callable) -> bool:
+        return getattr(callback, "__self__", None) is not None and hasattr(callback, "__func__")
+
+class Dispatcher:
+    """
+    The worker pool and the loop running coroutine callbacks of an Observer, both created on first use.
+    Doesn't reference the Observer, so it can still be shut down by a finalizer once the Observer got collected.
+    """
     def __init__(self):
+        self.executor: ThreadPoolExecutor = None
+        self.loop: asyncio.AbstractEventLoop = None
+        self.loop_thread: threading.Thread = None
+        self._lock = threading.Lock()
+
+    def get_executor(self, max_workers: int = None) -> ThreadPoolExecutor:
+        with self._lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="AssetObserver")
+            return self.executor
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.loop_thread = threading.Thread(target=self._run_loop, args=(self.loop,), name="AssetObserverLoop",
+                                                    daemon=True)
+                self.loop_thread.start()
+            return self.loop
+
+    def is_loop_thread(self) -> bool:
+        return threading.current_thread() is self.loop_thread
+
+    def close(self, wait: bool = True):
+        """
+        Stops the loop and the worker pool, the loop gets closed by its own thread once it stopped
+        :param wait: Waits for running callbacks and the loop thread, skipped when called from one of these threads
+        """
+        with self._lock:
+            executor, self.executor = self.executor, None
+            loop, self.loop = self.loop, None
+            loop_thread, self.loop_thread = self.loop_thread, None
+
+        current = threading.current_thread()
+
+        if executor:
+            executor.shutdown(wait=wait and current not in getattr(executor, "_threads", ()))
+
+        if loop:
+            loop.call_soon_threadsafe(loop.stop)
+            if wait and current is not loop_thread:
+                loop_thread.join()
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop):
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+class Observer:
+    def __init__(self, mode: DispatchMode = DispatchMode.THREADED, max_workers: int = None):
         self.observers: list = []
+        self.mode: DispatchMode = mode
+        self.max_workers: int = max_workers
+
+        # Observers that get dropped without close(), e.g. with their Manager, still release the threads and the fds
+        # of the loop. The finalizer may run on any thread, so it doesn't wait for them.
+        self._dispatcher = Dispatcher()
+        self._finalizer = weakref.finalize(self, self._dispatcher.close, False)
+        self._local = threading.local()
+        self.stats: ObserverStats = None
+
+        # Index of topic -> key -> observers, None stands for "any" so unfiltered observers sit at [None][None]
+        self._index: dict = {}
+        self._filters: dict[callable, tuple] = {}
+        self._order: dict[callable, int] = {}
+        self._next_order: int = 0
+        self._subscription_lock = threading.RLock()
 
-    def subscribe(self, observer: callable):
-        if observer not in self.observers:
-            self.observers.append(observer)
+        # Weak subscriptions by the object and function of their bound method, so unsubscribe finds them again
+        self._weak: dict[tuple[int, int], WeakCallback] = {}
+        self._dead: list[WeakCallback] = []
+
+    def subscribe(self, observer: callable, topics=None, keys=None, weak: bool = False):
+        """
+        Subscribes the observer, by default it receives every notification
+        :param topics: Only notify for these topics (the first notify argument), a single topic or an iterable of them
+        :param keys: Only notify for these keys (the second notify argument), a single key or an iterable of them
+        :param weak: Bound methods don't keep their object alive and get unsubscribed once it got collected.
+                     Other callables are always held strongly.
+        """
+        with self._subscription_lock:
+            self._purge_dead()
+
+            if WeakCallback.supports(observer):
+                weak_callback = self._get_weak(observer)
+                if weak_callback:
+                    observer = weak_callback
+                elif weak:
+                    observer = WeakCallback(observer, self._dead.append)
+                    self._weak[observer.key] = observer
+
+            if observer in self._filters:
+                self._remove_from_index(observer)
+            else:
+                self.observers.append(observer)
+                self._order[observer] = self._next_order
+                self._next_order += 1
+
+            self._filters[observer] = (self._to_filter(topics), self._to_filter(keys))
+            self._add_to_index(observer)
 
     def unsubscribe(self, observer: callable):
-        if observer in self.observers:
-            self.observers.remove(observer)
+        with self._subscription_lock:
+            if WeakCallback.supports(observer):
+                observer = self._get_weak(observer) or observer
+
+            if observer in self.observers:
+                self.observers.remove(observer)
+                self._remove_from_index(observer)
+                del self._filters[observer]
+                del self._order[observer]
+
+            if isinstance(observer, WeakCallback) and self._weak.get(observer.key) is observer:
+                del self._weak[observer.key]
+
+    def _get_weak(self, method) -> WeakCallback | None:
+        weak_callback = self._weak.get(WeakCallback.get_key(method))
+        return weak_callback if weak_callback and weak_callback.matches(method) else None
+
+    def _purge_dead(self):
+        # Collected objects only get queued by the weakref callback, which can run on any thread in the middle of a
+        # notify, the subscriptions are cleaned up here instead
+        while self._dead:
+            self.unsubscribe(self._dead.pop())
+
+    def get_subscribers(self) -> list[dict]:
+        """
+        Returns the live subscribers in the order they subscribed in with their filters, meant for debugging leaks
+        """
+        with self._subscription_lock:
+            self._purge_dead()
+
+            report = []
+            for observer in self.observers:
+                topics, keys = self._filters[observer]
+                weak = isinstance(observer, WeakCallback)
+                report.append({
+                    "listener": observer.name if weak else get_callback_name(observer),
+                    "weak": weak,
+                    "topics": None if topics is None else sorted(str(getattr(topic, "name", topic)) for topic in topics),
+                    "keys": None if keys is None else sorted(keys),
+                })
+            return report
 
     def notify(self, *args, **kwargs):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(self._notify(*args, **kwargs))
-
-    async def _notify(self, *args, **kwargs):
-        coroutines = [self._ensure_coroutine(observer, *args, **kwargs) for observer in self.observers]
-        await asyncio.gather(*coroutines)
-
-    async def _ensure_coroutine(self, callback: callable, *args, **kwargs):
-        if asyncio.iscoroutinefunction(callback):
-            return await callback(*args, **kwargs)
-        else:
-            try:
-                return await asyncio.to_thread(callback, *args, **kwargs)
-            except Exception as e:
-                #log.error(f"Callback {callback.__name__} in {self.event_id} could not be called")
-                return await asyncio.sleep(0)
\ No newline at end of file
+        """
+        Notifies every observer whose filters match the first argument as topic and the second one as key
+        """
+        topic = args[0] if args else None
+        key = args[1] if len(args) > 1 and isinstance(args[1], str) else None
+        self.publish((topic,), (key,) if key is not None else (), *args, **kwargs)
+
+    def publish(self, topics, keys, *args, **kwargs):
+        """
+        Notifies every observer subscribed to any of the topics and any of the keys, passing args and kwargs
+        """
+        self._dispatch(self._match(topics, keys), args, kwargs)
+
+    def publish_where(self, accept: callable, topics, keys, *args, **kwargs):
+        """
+        Like publish, but only notifies the observers whose topic filter passes accept
+        :param accept: Called with the topic filter of an observer, a frozenset or None for observers of all topics
+        """
+        self._dispatch(self._match(topics, keys, accept), args, kwargs)
+
+    def _dispatch(self, observers: list, args: tuple, kwargs: dict):
+        if not observers:
+            return
+
+        # Nested notifies from inside a callback run inline, waiting on our own pool from one of its workers could
+        # otherwise deadlock once every worker is busy
+        if self.mode == DispatchMode.SYNC or getattr(self._local, "dispatching", False):
+            for observer in observers:
+                self._call(observer, *args, **kwargs)
+            return
+
+        executor = self._dispatcher.get_executor(self.max_workers)
+        futures = [executor.submit(self._call, observer, *args, **kwargs) for observer in observers]
+
+        if self.mode == DispatchMode.THREADED:
+            wait(futures)
+
+    def _match(self, topics, keys, accept: callable = None) -> list:
+        with self._subscription_lock:
+            self._purge_dead()
+            matched = set()
+
+            for topic in (None, *topics):
+                by_key = self._index.get(topic)
+                if not by_key:
+                    continue
+                for key in (None, *keys):
+                    matched.update(by_key.get(key, ()))
+
+            if accept:
+                matched = {observer for observer in matched if accept(self._filters[observer][0])}
+
+            # Observers are called in the order they subscribed in
+            return sorted(matched, key=self._order.__getitem__)
+
+    def _add_to_index(self, observer: callable):
+        topics, keys = self._filters[observer]
+
+        for topic in topics or (None,):
+            by_key = self._index.setdefault(topic, {})
+            for key in keys or (None,):
+                by_key.setdefault(key, set()).add(observer)
+
+    def _remove_from_index(self, observer: callable):
+        topics, keys = self._filters[observer]
+
+        for topic in topics or (None,):
+            by_key = self._index[topic]
+            for key in keys or (None,):
+                by_key[key].discard(observer)
+                if not by_key[key]:
+                    del by_key[key]
+            if not by_key:
+                del self._index[topic]
+
+    @staticmethod
+    def _to_filter(values) -> frozenset | None:
+        if values is None:
+            return None
+        if isinstance(values, (str, enum.Enum)) or not hasattr(values, "__iter__"):
+            return frozenset((values,))
+        return frozenset(values)
+
+    def enable_stats(self, name: str = "Observer") -> ObserverStats:
+        """
+        Starts recording call counts, times and failures of every observer
+        """
+        if self.stats is None:
+            self.stats = ObserverStats(name)
+        return self.stats
+
+    def disable_stats(self):
+        if self.stats:
+            self.stats.stop_logging()
+        self.stats = None
+
+    def close(self):
+        """
+        Stops the dispatcher loop and the worker pool. They get recreated on the next notify.
+        """
+        self._dispatcher.close()
+
+    def _call(self, callback: callable, *args, **kwargs):
+        if isinstance(callback, WeakCallback):
+            callback = callback.resolve()
+            if callback is None:
+                return None
+
+        dispatching = getattr(self._local, "dispatching", False)
+        self._local.dispatching = True
+
+        stats = self.stats
+        start = time.perf_counter()
+        error = None
+
+        try:
+            if asyncio.iscoroutinefunction(callback):
+                return self._run_coroutine(callback(*args, **kwargs))
+            return callback(*args, **kwargs)
+        except Exception as e:
+            error = e
+            log.error(f"Callback {get_callback_name(callback)} failed for {args[0] if args else None}: {e}")
+            return None
+        finally:
+            self._local.dispatching = dispatching
+
+            if stats:
+                stats.record(callback, args[0] if args else None, time.perf_counter() - start, error)
+
+    def _run_coroutine(self, coroutine):
+        loop = self._dispatcher.get_loop()
+
+        # Already on the dispatcher loop (a coroutine callback notified again), blocking here would stall the loop
+        if self._dispatcher.is_loop_thread():
+            return loop.create_task(coroutine)
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
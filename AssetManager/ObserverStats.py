@@ -0,0 +1,148 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Opt-in instrumentation for the Observer. Records how often every listener gets called, how long it takes and how often
+it fails, split by the topic (ManagerEvent) it got called for.
+"""
+
+import threading
+
+from loguru import logger as log
+
+def get_callback_name(callback: callable) -> str:
+    name = getattr(callback, "__qualname__", None) or repr(callback)
+    owner = getattr(callback, "__self__", None)
+
+    # Bound methods of different instances should show up as different listeners
+    if owner is not None:
+        return f"{name}@{id(owner):x}"
+    return name
+
+class ListenerStats:
+    def __init__(self, listener: str, topic):
+        self.listener: str = listener
+        self.topic = topic
+        self.calls: int = 0
+        self.failures: int = 0
+        self.total_time: float = 0.0
+        self.max_time: float = 0.0
+        self.last_error: str = None
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "listener": self.listener,
+            "topic": str(getattr(self.topic, "name", self.topic)),
+            "calls": self.calls,
+            "failures": self.failures,
+            "total_time": self.total_time,
+            "mean_time": self.mean_time,
+            "max_time": self.max_time,
+            "last_error": self.last_error,
+        }
+
+class ObserverStats:
+    def __init__(self, name: str = "Observer"):
+        self.name: str = name
+        self._stats: dict[tuple, ListenerStats] = {}
+        self._lock = threading.Lock()
+        self._log_timer: threading.Timer = None
+        self._log_interval: float = None
+
+    def record(self, callback: callable, topic, duration: float, error: Exception = None):
+        listener = get_callback_name(callback)
+
+        with self._lock:
+            stats = self._stats.get((listener, topic))
+            if stats is None:
+                stats = self._stats[(listener, topic)] = ListenerStats(listener, topic)
+
+            stats.calls += 1
+            stats.total_time += duration
+            stats.max_time = max(stats.max_time, duration)
+
+            if error is not None:
+                stats.failures += 1
+                stats.last_error = f"{type(error).__name__}: {error}"
+
+    def get_stats(self, topic=None) -> list[ListenerStats]:
+        """
+        :param topic: Only returns the stats for this topic when set
+        """
+        with self._lock:
+            return [stats for stats in self._stats.values() if topic is None or stats.topic == topic]
+
+    def get_listener_totals(self) -> dict[str, ListenerStats]:
+        """
+        Returns the stats of every listener summed up over all topics
+        """
+        totals = {}
+
+        for stats in self.get_stats():
+            total = totals.setdefault(stats.listener, ListenerStats(stats.listener, None))
+            total.calls += stats.calls
+            total.failures += stats.failures
+            total.total_time += stats.total_time
+            total.max_time = max(total.max_time, stats.max_time)
+            total.last_error = stats.last_error or total.last_error
+        return totals
+
+    def get_slowest(self, count: int = 5, by: str = "mean_time") -> list[ListenerStats]:
+        """
+        Returns the slowest listeners over all topics
+        :param by: "mean_time", "total_time" or "max_time"
+        """
+        totals = self.get_listener_totals().values()
+        return sorted(totals, key=lambda stats: getattr(stats, by), reverse=True)[:count]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_dict(self) -> list[dict]:
+        return [stats.to_dict() for stats in self.get_stats()]
+
+    #
+    # LOGGING
+    #
+
+    def log_summary(self, count: int = 5):
+        slowest = self.get_slowest(count)
+
+        if not slowest:
+            return
+
+        lines = [f"{stats.listener}: {stats.calls} calls, {stats.mean_time * 1000:.2f}ms mean, "
+                 f"{stats.max_time * 1000:.2f}ms max, {stats.failures} failures" for stats in slowest]
+        log.info(f"Slowest listeners of {self.name}:\n" + "\n".join(lines))
+
+    def start_logging(self, interval: float):
+        """
+        Logs the slowest listeners every interval seconds until stop_logging is called
+        """
+        self.stop_logging()
+        self._log_interval = interval
+        self._schedule_log()
+
+    def stop_logging(self):
+        self._log_interval = None
+
+        if self._log_timer:
+            self._log_timer.cancel()
+            self._log_timer = None
+
+    def _schedule_log(self):
+        self._log_timer = threading.Timer(self._log_interval, self._on_log_timer)
+        self._log_timer.daemon = True
+        self._log_timer.start()
+
+    def _on_log_timer(self):
+        if self._log_interval is None:
+            return
+
+        self.log_summary()
+        self._schedule_log()
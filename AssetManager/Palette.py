@@ -0,0 +1,268 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Compact storage for large sets of colors. ColorStore keeps the values of many colors in one contiguous RGBA byte array,
+every color only owns the index of its slot. The Color assets store their values in a shared ColorStore, so a Palette
+following the colors Manager only links its keys to the slots of the Colors instead of copying them. The normalized
+float values used by Gtk get converted for the whole store at once and kept until colors change.
+"""
+
+import threading
+from array import array
+
+from .AssetManagerBackend import Manager, ManagerMirror
+
+class ColorStore:
+    CHANNELS = 4
+
+    def __init__(self):
+        self._values = array("B")
+        self._floats: array = None
+        # Slots that got freed and can be handed out again, freed without the lock as colors free them when collected
+        self._free: list[int] = []
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._values) // self.CHANNELS - len(self._free)
+
+    def allocate(self, color: tuple[int, int, int, int]) -> int:
+        """
+        Stores the color in a free slot and returns the slot
+        """
+        with self._lock:
+            try:
+                slot = self._free.pop()
+            except IndexError:
+                return self.extend((color,))
+
+            self.write(slot, color)
+            return slot
+
+    def extend(self, colors) -> int:
+        """
+        Stores the colors in new slots following each other
+        :return: The slot of the first color
+        """
+        values = array("B")
+        for color in colors:
+            values.extend(self.clamp(color))
+        return self.extend_bytes(values.tobytes())
+
+    def extend_bytes(self, data: bytes) -> int:
+        """
+        Stores raw RGBA values in new slots following each other
+        :return: The slot of the first color
+        """
+        with self._lock:
+            first = len(self._values) // self.CHANNELS
+            self._values.frombytes(data)
+            if self._floats is not None:
+                self._floats.extend(value / 255.0 for value in data)
+            return first
+
+    def write(self, slot: int, color: tuple[int, int, int, int]):
+        values = self.clamp(color)
+        start = slot * self.CHANNELS
+
+        with self._lock:
+            self._values[start:start + self.CHANNELS] = array("B", values)
+            if self._floats is not None:
+                self._floats[start:start + self.CHANNELS] = array("f", (value / 255.0 for value in values))
+
+    def read(self, slot: int) -> tuple[int, int, int, int]:
+        start = slot * self.CHANNELS
+        with self._lock:
+            return tuple(self._values[start:start + self.CHANNELS])
+
+    def read_floats(self, slot: int) -> tuple[float, float, float, float]:
+        start = slot * self.CHANNELS
+        with self._lock:
+            return tuple(self.get_float_view()[start:start + self.CHANNELS])
+
+    def gather(self, slots) -> bytes:
+        """
+        Returns the raw RGBA values of the slots in the given order
+        """
+        gathered = array("B")
+        with self._lock:
+            values = self._values
+            for slot in slots:
+                start = slot * self.CHANNELS
+                gathered.extend(values[start:start + self.CHANNELS])
+        return gathered.tobytes()
+
+    def free(self, slot: int):
+        self._free.append(slot)
+
+    def get_float_view(self) -> array:
+        """
+        Returns the normalized values of all slots, converted in one go and cached until colors change.
+        The values of a slot start at slot * CHANNELS, freed slots hold the values of their last color.
+        """
+        with self._lock:
+            if self._floats is None:
+                lookup = [value / 255.0 for value in range(256)]
+                self._floats = array("f", [lookup[value] for value in self._values])
+            return self._floats
+
+    @staticmethod
+    def clamp(color) -> list[int]:
+        return [min(255, max(0, int(round(value)))) for value in color]
+
+class Palette(ManagerMirror):
+    CHANNELS = ColorStore.CHANNELS
+
+    def __init__(self, colors: dict[str, tuple[int, int, int, int]] = None, store: ColorStore = None):
+        """
+        Colors by key, stored in a ColorStore
+        :param colors: Colors to import
+        :param store: Store holding the values, use the store of the Color assets to link keys to Colors without
+                      copying them. A new store gets created by default.
+        """
+        self.store: ColorStore = store or ColorStore()
+
+        # Key -> the slot the palette owns or a linked Color, which stays alive and keeps its slot while it's linked
+        self._index: dict = {}
+        self._lock = threading.RLock()
+
+        self._manager: Manager = None
+
+        if colors:
+            self.import_colors(colors)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key: str):
+        return key in self._index
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._index)
+
+    def get_slot(self, key: str) -> int | None:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        return entry if isinstance(entry, int) else entry.slot
+
+    def set(self, key: str, color: tuple[int, int, int, int]):
+        """
+        Copies the values of the color into a slot owned by the palette
+        """
+        with self._lock:
+            entry = self._index.get(key)
+
+            if isinstance(entry, int):
+                self.store.write(entry, color)
+                return
+
+            self._index[key] = self.store.allocate(color)
+
+    def link(self, key: str, color):
+        """
+        Shows the Color under the key without copying its values, the Color has to be stored in the store of the palette
+        """
+        if color.store is not self.store:
+            raise ValueError("The color is stored in another ColorStore than the palette")
+
+        with self._lock:
+            entry = self._index.get(key)
+            if isinstance(entry, int):
+                self.store.free(entry)
+
+            self._index[key] = color
+
+    def get(self, key: str, default=None) -> tuple[int, int, int, int] | None:
+        slot = self.get_slot(key)
+        return default if slot is None else self.store.read(slot)
+
+    def get_floats(self, key: str, default=None) -> tuple[float, float, float, float] | None:
+        """
+        Returns the color normalized to 0-1 like Gdk.RGBA expects it
+        """
+        slot = self.get_slot(key)
+        return default if slot is None else self.store.read_floats(slot)
+
+    def get_float_view(self) -> array:
+        """
+        Returns the normalized values of the whole store, the values of a key start at get_slot(key) * CHANNELS
+        """
+        return self.store.get_float_view()
+
+    def remove(self, key: str):
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if isinstance(entry, int):
+                self.store.free(entry)
+
+    def clear(self):
+        with self._lock:
+            for entry in self._index.values():
+                if isinstance(entry, int):
+                    self.store.free(entry)
+            self._index.clear()
+
+    #
+    # BULK
+    #
+
+    def import_colors(self, colors: dict[str, tuple[int, int, int, int]]):
+        with self._lock:
+            new_keys = []
+
+            for key, color in colors.items():
+                if isinstance(self._index.get(key), int):
+                    self.set(key, color)
+                else:
+                    new_keys.append(key)
+
+            first = self.store.extend(colors[key] for key in new_keys)
+            for i, key in enumerate(new_keys):
+                self._index[key] = first + i
+
+    def export_colors(self) -> dict[str, tuple[int, int, int, int]]:
+        with self._lock:
+            return {key: self.store.read(self.get_slot(key)) for key in self._index}
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the raw RGBA values of all colors in the order of keys()
+        """
+        with self._lock:
+            return self.store.gather([self.get_slot(key) for key in self._index])
+
+    def load_bytes(self, keys: list[str], data: bytes):
+        """
+        Replaces the palette with raw RGBA values as returned by to_bytes
+        """
+        if len(data) != len(keys) * self.CHANNELS:
+            raise ValueError(f"Expected {len(keys) * self.CHANNELS} bytes for {len(keys)} colors, got {len(data)}")
+
+        with self._lock:
+            self.clear()
+            first = self.store.extend_bytes(data)
+            self._index = {key: first + i for i, key in enumerate(keys)}
+
+    #
+    # MANAGER
+    #
+
+    def sync_all(self, manager: Manager):
+        self.sync(manager, list(manager.get_assets_merged()))
+
+    def sync(self, manager: Manager, keys):
+        """
+        Links the keys to their merged Color in the Manager, colors of other stores get copied, keys without a color
+        get removed
+        """
+        with self._lock:
+            for key in keys:
+                color = manager.get_asset(key)
+                if color is None:
+                    self.remove(key)
+                elif getattr(color, "store", None) is self.store:
+                    self.link(key, color)
+                else:
+                    self.set(key, color.get_values())
@@ -0,0 +1,181 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Formats the AssetManager can store its overrides in. Every format writes the same structure,
+{section: {key: value}} where the section is the save key of a Manager and the value is what Asset.to_json returned.
+The format of a file is detected when reading it, so switching the format migrates the file on the next save.
+"""
+
+import io
+import json
+import struct
+
+class Serializer:
+    name: str = None
+
+    def dumps(self, save_json: dict) -> bytes:
+        pass
+
+    def load(self, file: io.BufferedIOBase, sections: list[str] = None) -> dict:
+        """
+        Reads the save data from the file
+        :param sections: Only these sections get returned, all sections when not set
+        """
+        pass
+
+    def matches(self, header: bytes) -> bool:
+        """
+        Returns if the first bytes of a file are written in this format
+        """
+        return False
+
+class JsonSerializer(Serializer):
+    """
+    The original format, pretty printed json
+    """
+    name = "json"
+
+    def dumps(self, save_json: dict) -> bytes:
+        return json.dumps(save_json, indent=4).encode()
+
+    def load(self, file: io.BufferedIOBase, sections: list[str] = None) -> dict:
+        data = json.load(file)
+
+        if sections is None or not isinstance(data, dict):
+            return data
+        return {section: data[section] for section in sections if section in data}
+
+    def matches(self, header: bytes) -> bool:
+        return header.lstrip()[:1] in (b"{", b"")
+
+class CompactJsonSerializer(JsonSerializer):
+    """
+    Json without any whitespace, reading it is the same as reading the original format
+    """
+    name = "compact-json"
+
+    def dumps(self, save_json: dict) -> bytes:
+        return json.dumps(save_json, separators=(",", ":")).encode()
+
+class BinarySerializer(Serializer):
+    """
+    Layout, all numbers little endian:
+    header:  magic "SCAM" | version u16 | section count u16
+    section: name length u16 | name | record count u32 | payload length u32 | payload
+    record:  key length u16 | key | value type u8 | value length u32 | value
+
+    Sections store their payload length, so sections that aren't requested get skipped without reading them.
+    """
+    name = "binary"
+
+    MAGIC = b"SCAM"
+    VERSION = 1
+
+    TYPE_JSON = 0
+    TYPE_RGBA = 1
+    TYPE_STRING = 2
+
+    _HEADER = struct.Struct("<4sHH")
+    _SECTION = struct.Struct("<II")
+    _U16 = struct.Struct("<H")
+    _RECORD = struct.Struct("<BI")
+
+    def dumps(self, save_json: dict) -> bytes:
+        out = bytearray(self._HEADER.pack(self.MAGIC, self.VERSION, len(save_json)))
+
+        for section, records in save_json.items():
+            payload = bytearray()
+            for key, value in records.items():
+                payload += self._pack_string(key)
+                value_type, value_data = self._encode_value(value)
+                payload += self._RECORD.pack(value_type, len(value_data))
+                payload += value_data
+
+            out += self._pack_string(section)
+            out += self._SECTION.pack(len(records), len(payload))
+            out += payload
+
+        return bytes(out)
+
+    def load(self, file: io.BufferedIOBase, sections: list[str] = None) -> dict:
+        return {section: dict(records) for section, records in self.iter_sections(file, sections)}
+
+    def iter_sections(self, file: io.BufferedIOBase, sections: list[str] = None):
+        """
+        Streams the sections of the file, yields the section name and an iterator over its records.
+        Each record iterator has to be used up before continuing with the next section.
+        """
+        magic, version, section_count = self._HEADER.unpack(self._read(file, self._HEADER.size))
+
+        if magic != self.MAGIC:
+            raise ValueError("Not a binary asset file")
+        if version > self.VERSION:
+            raise ValueError(f"Binary asset file version {version} is newer than the supported version {self.VERSION}")
+
+        for _ in range(section_count):
+            section = self._read_string(file)
+            record_count, payload_length = self._SECTION.unpack(self._read(file, self._SECTION.size))
+
+            if sections is not None and section not in sections:
+                file.seek(payload_length, io.SEEK_CUR)
+                continue
+
+            yield section, self._iter_records(file, record_count)
+
+    def matches(self, header: bytes) -> bool:
+        return header.startswith(self.MAGIC)
+
+    def _iter_records(self, file: io.BufferedIOBase, record_count: int):
+        for _ in range(record_count):
+            key = self._read_string(file)
+            value_type, value_length = self._RECORD.unpack(self._read(file, self._RECORD.size))
+            yield key, self._decode_value(value_type, self._read(file, value_length))
+
+    def _encode_value(self, value) -> tuple[int, bytes]:
+        if isinstance(value, str):
+            return self.TYPE_STRING, value.encode()
+        if (isinstance(value, (list, tuple)) and len(value) == 4
+                and all(isinstance(channel, int) and 0 <= channel <= 255 for channel in value)):
+            return self.TYPE_RGBA, bytes(value)
+        return self.TYPE_JSON, json.dumps(value, separators=(",", ":")).encode()
+
+    def _decode_value(self, value_type: int, data: bytes):
+        if value_type == self.TYPE_STRING:
+            return data.decode()
+        if value_type == self.TYPE_RGBA:
+            return list(data)
+        if value_type == self.TYPE_JSON:
+            return json.loads(data)
+        raise ValueError(f"Unknown value type {value_type}")
+
+    def _pack_string(self, value: str) -> bytes:
+        encoded = value.encode()
+        return self._U16.pack(len(encoded)) + encoded
+
+    def _read_string(self, file: io.BufferedIOBase) -> str:
+        length = self._U16.unpack(self._read(file, self._U16.size))[0]
+        return self._read(file, length).decode()
+
+    @staticmethod
+    def _read(file: io.BufferedIOBase, size: int) -> bytes:
+        data = file.read(size)
+        if len(data) != size:
+            raise ValueError("Binary asset file ended unexpectedly")
+        return data
+
+SERIALIZERS: dict[str, Serializer] = {serializer.name: serializer for serializer in
+                                      (JsonSerializer(), CompactJsonSerializer(), BinarySerializer())}
+
+def get_serializer(name: str) -> Serializer:
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown save format {name}, available formats: {', '.join(SERIALIZERS)}")
+    return SERIALIZERS[name]
+
+def detect_serializer(header: bytes) -> Serializer:
+    """
+    Returns the serializer that can read a file starting with the header
+    """
+    if SERIALIZERS[BinarySerializer.name].matches(header):
+        return SERIALIZERS[BinarySerializer.name]
+    return SERIALIZERS[JsonSerializer.name]
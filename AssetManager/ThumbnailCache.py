@@ -0,0 +1,86 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Process wide cache for the scaled previews shown in the AssetManagerWindow, so reopening the window doesn't convert and
+scale every icon again.
+"""
+
+import threading
+import weakref
+
+from .AssetManagerBackend import Manager, ManagerEvent, get_event_keys
+from .MediaCache import LRUCache
+
+class ThumbnailCache:
+    INVALIDATING_EVENTS = [ManagerEvent.REMOVE, ManagerEvent.CHANGE, ManagerEvent.OVERRIDE_ADD,
+                           ManagerEvent.OVERRIDE_REMOVE, ManagerEvent.OVERRIDE_CHANGE, ManagerEvent.BATCH]
+
+    def __init__(self, max_items: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.cache = LRUCache(max_items, max_bytes, size_of=self._get_pixbuf_bytes, on_evict=self._forget)
+        # Asset key -> cache keys of its thumbnails, so changes of the asset can drop them. The lock is never held while
+        # calling into the cache, evictions call back into here while the cache holds its own lock.
+        self._cache_keys: dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._watched = weakref.WeakSet()
+
+    def get(self, key: str, identity, size: tuple[int, int], create: callable):
+        """
+        Returns the thumbnail for the asset or creates and stores it
+        :param key: Key of the asset in its Manager
+        :param identity: Identifies the source the thumbnail gets created from, e.g. the path and mtime of an icon
+        :param size: Size the thumbnail gets scaled to
+        :param create: Creates the thumbnail if it isn't cached yet
+        """
+        if identity is None:
+            return create()
+
+        cache_key = (key, identity, tuple(size))
+        with self._lock:
+            self._cache_keys.setdefault(key, set()).add(cache_key)
+        return self.cache.get_or_load(cache_key, create)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            cache_keys = self._cache_keys.pop(key, ())
+
+        for cache_key in cache_keys:
+            self.cache.remove(cache_key)
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            self._cache_keys.clear()
+
+    def _forget(self, cache_key: tuple):
+        with self._lock:
+            cache_keys = self._cache_keys.get(cache_key[0])
+            if cache_keys is None:
+                return
+
+            cache_keys.discard(cache_key)
+            if not cache_keys:
+                del self._cache_keys[cache_key[0]]
+
+    def watch(self, manager: Manager):
+        """
+        Drops the thumbnails of assets as soon as they change in the Manager
+        """
+        if manager in self._watched:
+            return
+
+        self._watched.add(manager)
+        manager.add_listener(self.on_manager_event, events=self.INVALIDATING_EVENTS, weak=True)
+
+    def on_manager_event(self, event: ManagerEvent, *args):
+        for key in get_event_keys(event, args):
+            self.invalidate(key)
+
+    @staticmethod
+    def _get_pixbuf_bytes(pixbuf) -> int:
+        try:
+            return pixbuf.get_byte_length()
+        except AttributeError:
+            return 0
+
+thumbnail_cache = ThumbnailCache()
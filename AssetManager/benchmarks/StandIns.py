@@ -0,0 +1,55 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Stand-ins for the StreamController modules the AssetManager imports, so the benchmarks can run headless and without a
+StreamController checkout. Call install() before importing anything from the AssetManager.
+"""
+
+import sys
+import types
+
+from PIL import Image
+
+class StandInMedia:
+    """
+    Behaves like src.backend.DeckManagement.Media.Media for the parts the AssetManager uses
+    """
+    decode_count = 0
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+
+    @classmethod
+    def from_path(cls, path: str):
+        cls.decode_count += 1
+
+        with Image.open(path) as image:
+            return cls(image.convert("RGBA"))
+
+    def get_final_media(self) -> Image.Image:
+        return self.image.copy()
+
+def image2pixbuf(image):
+    # No Gtk here, the conversion is approximated by copying the raw pixel data
+    return image.tobytes()
+
+def install():
+    modules = {
+        "src": None,
+        "src.backend": None,
+        "src.backend.DeckManagement": None,
+        "src.backend.DeckManagement.Media": None,
+        "src.backend.DeckManagement.Media.Media": {"Media": StandInMedia},
+        "src.backend.DeckManagement.ImageHelpers": {"image2pixbuf": image2pixbuf},
+    }
+
+    for name, attributes in modules.items():
+        if name in sys.modules:
+            continue
+
+        module = types.ModuleType(name)
+        module.__path__ = []
+        for attribute, value in (attributes or {}).items():
+            setattr(module, attribute, value)
+        sys.modules[name] = module
@@ -0,0 +1,211 @@
+"""
+Author: G4PLS
+Year: 2024
+
+Benchmarks for the hot paths of the AssetManager: loading and saving the override file, reading the merged assets and
+notifying listeners. Every case is run for each combination of asset count, override ratio and listener count and the
+results are written as JSON lines, one per case.
+
+Run from the directory containing the AssetManager folder:
+python -m AssetManager.benchmarks.bench_asset_manager --assets 100 1000 --output results.jsonl
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from .StandIns import StandInMedia, install
+
+install()
+
+from PIL import Image
+
+from ..AssetManager import AssetManager, Color, Icon
+from ..AssetManagerBackend import ManagerEvent
+from ..Observer import DispatchMode, Observer
+from ..Serializers import SERIALIZERS, JsonSerializer
+
+ICON_FILE_COUNT = 32
+
+def measure(function: callable, repeat: int, setup: callable = None) -> list[float]:
+    runs = []
+
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        function(state)
+        runs.append(time.perf_counter() - start)
+    return runs
+
+def create_icon_files(directory: str, size: int) -> list[str]:
+    paths = []
+
+    for i in range(ICON_FILE_COUNT):
+        path = os.path.join(directory, f"icon_{i}.png")
+        Image.new("RGBA", (size, size), (i * 8 % 256, 64, 128, 255)).save(path)
+        paths.append(path)
+    return paths
+
+def write_save_file(save_path: str, icon_paths: list[str], asset_count: int, override_ratio: float):
+    override_count = int(asset_count * override_ratio)
+
+    save_json = {
+        "icons": {f"icon_{i}": icon_paths[i % len(icon_paths)] for i in range(override_count)},
+        "colors": {f"color_{i}": [i % 256, 0, 0, 255] for i in range(override_count)},
+    }
+
+    with open(save_path, "w") as file:
+        json.dump(save_json, file, indent=4)
+
+def add_defaults(asset_manager: AssetManager, icon_paths: list[str], asset_count: int):
+    with asset_manager.icons.batch(), asset_manager.colors.batch():
+        for i in range(asset_count):
+            asset_manager.icons.add_asset(f"icon_{i}", Icon(path=icon_paths[i % len(icon_paths)]))
+            asset_manager.colors.add_asset(f"color_{i}", Color(color=(0, i % 256, 0, 255)))
+
+#
+# CASES
+#
+
+def bench_load(directory: str, icon_paths: list[str], params: dict, repeat: int) -> list[float]:
+    save_path = os.path.join(directory, "load.json")
+    write_save_file(save_path, icon_paths, params["assets"], params["override_ratio"])
+
+    # Migrates the file so every run reads the format being measured
+    AssetManager(save_path, render_cache=False, save_format=params["save_format"]).close()
+
+    def setup():
+        # Every run starts cold, otherwise only the first run would decode anything
+        Icon.cache.clear()
+
+    def run(_):
+        asset_manager = AssetManager(save_path, render_cache=False, load_workers=params["load_workers"],
+                                     save_format=params["save_format"])
+        for icon in asset_manager.icons.get_overrides().values():
+            icon.get_rendered()
+        asset_manager.close()
+
+    return measure(run, repeat, setup)
+
+def bench_save(directory: str, icon_paths: list[str], params: dict, repeat: int) -> list[float]:
+    save_path = os.path.join(directory, "save.json")
+    write_save_file(save_path, icon_paths, params["assets"], params["override_ratio"])
+    asset_manager = AssetManager(save_path, render_cache=False, save_format=params["save_format"])
+
+    def setup():
+        # Changes one color so the save can't be skipped
+        asset_manager.colors.add_override("bench", Color(color=(time.perf_counter_ns() % 256, 0, 0, 255)),
+                                          skip_asset_check=True, override=True)
+
+    def run(_):
+        asset_manager.save()
+
+    runs = measure(run, repeat, setup)
+    asset_manager.close()
+    return runs
+
+def bench_merged(directory: str, icon_paths: list[str], params: dict, repeat: int) -> list[float]:
+    save_path = os.path.join(directory, "merged.json")
+    write_save_file(save_path, icon_paths, params["assets"], params["override_ratio"])
+    asset_manager = AssetManager(save_path, render_cache=False)
+    add_defaults(asset_manager, icon_paths, params["assets"])
+
+    def run(_):
+        for _ in range(100):
+            for _ in asset_manager.icons.get_assets_merged().items():
+                pass
+
+    runs = measure(run, repeat)
+    asset_manager.close()
+    return runs
+
+def bench_notify(directory: str, icon_paths: list[str], params: dict, repeat: int) -> list[float]:
+    observer = Observer(DispatchMode[params["dispatch_mode"]])
+    calls = []
+
+    for i in range(params["listeners"]):
+        observer.subscribe(lambda *args, i=i: calls.append(i))
+
+    def run(_):
+        for i in range(params["assets"]):
+            observer.notify(ManagerEvent.CHANGE, f"icon_{i}")
+
+    runs = measure(run, repeat)
+    observer.close()
+    return runs
+
+CASES = {
+    "load": bench_load,
+    "save": bench_save,
+    "merged": bench_merged,
+    "notify": bench_notify,
+}
+
+def get_param_grid(args) -> dict[str, list[dict]]:
+    grid = {name: [] for name in args.cases}
+
+    for assets in args.assets:
+        for ratio in args.override_ratios:
+            for save_format in args.save_formats:
+                for workers in args.load_workers:
+                    grid.get("load", []).append({"assets": assets, "override_ratio": ratio,
+                                                 "load_workers": workers or None, "save_format": save_format})
+                grid.get("save", []).append({"assets": assets, "override_ratio": ratio, "save_format": save_format})
+            grid.get("merged", []).append({"assets": assets, "override_ratio": ratio})
+
+        for listeners in args.listeners:
+            for mode in args.dispatch_modes:
+                grid.get("notify", []).append({"assets": assets, "listeners": listeners, "dispatch_mode": mode})
+
+    return grid
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks the AssetManager with stand-in media")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--assets", nargs="+", type=int, default=[100, 1000])
+    parser.add_argument("--override-ratios", nargs="+", type=float, default=[0.1, 1.0])
+    parser.add_argument("--listeners", nargs="+", type=int, default=[1, 10, 50])
+    parser.add_argument("--dispatch-modes", nargs="+", choices=[mode.name for mode in DispatchMode],
+                        default=[mode.name for mode in DispatchMode])
+    parser.add_argument("--load-workers", nargs="+", type=int, default=[0, 4],
+                        help="Worker counts for the load case, 0 loads on the calling thread")
+    parser.add_argument("--save-formats", nargs="+", choices=list(SERIALIZERS), default=[JsonSerializer.name],
+                        help="Formats of the override file for the load and save cases")
+    parser.add_argument("--icon-size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="File to write the JSON lines to, defaults to stdout")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="asset-bench-")
+    output = open(args.output, "w") if args.output else sys.stdout
+
+    try:
+        icon_paths = create_icon_files(directory, args.icon_size)
+
+        for name, param_list in get_param_grid(args).items():
+            for params in param_list:
+                decodes = StandInMedia.decode_count
+                runs = CASES[name](directory, icon_paths, params, args.repeat)
+
+                result = {
+                    "case": name,
+                    "params": params,
+                    "median_seconds": statistics.median(runs),
+                    "min_seconds": min(runs),
+                    "runs": runs,
+                    "decodes": StandInMedia.decode_count - decodes,
+                }
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()